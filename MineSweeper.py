@@ -1,14 +1,22 @@
 '''
 SOLVER LOGIC:
- - Open all cells around '0' cells
- - Mark mine positions using first level logic
- - Open all cells around those which have the right amount of mines tagged
- - Select and open safe cells using second level logic (1-1 pattern):
-    - Find and store lists of codes on a temp map at unknowns susceptible of being solved using 1-1,
-      (while doing so, mark effective 2 cells to use for 1-2 checking later)
-    - Go through those locs, checking if 1-1 or 1-2 is present, and open cells accordingly
+ - Drain a work queue of cells whose neighbourhood changed (every revealed cell starts in it):
+    - Flood fill the connected region and numbered border of '0' cells
+    - Mark mine positions using first level logic
+    - Open all cells around those which have the right amount of mines tagged
+   Opening or marking a cell queues it and its revealed neighbours again
+ - Look up the windows of three numbers in a row (or column) around frontier cells in a table of
+   precomputed local patterns, open/mark the cells they force
+ - Select and open/mark cells using second level logic (1-1, 1-2 and larger patterns):
+    - Turn every frontier cell into a (set of unknowns, mines remaining) constraint
+    - Split them into independent components, open/mark the cells forced in every placement of
+      each component (solved once per component shape and cached), compare the constraints of
+      components too large to enumerate pairwise instead
  - If number of unknowns equals remainder of mines - tag them
  - If there's only one mine left, mark position which satisfies all unresolved cells
+ - If still stuck, split the frontier constraints into independent components, enumerate their
+   valid mine placements and combine them under the remaining mine count - open/mark cells which
+   are safe/mines in every solution
 '''
 
 # For colouring in commandline
@@ -28,250 +36,1870 @@ class colors:
     END = '\x1b[0m'
 
 ### Kata Solution code
+import io
+import os
+import struct
+import threading
 import numpy as np
-from collections import Counter
+from collections import OrderedDict, deque
+from functools import lru_cache, partial
+from math import comb
+from time import perf_counter
 
-DEBUG = True
+# Board geometry: neighbour table built once per board size and shared between solves
+# Cells are addressed by their linear index (row * W + column) into the flattened board.
+# The neighbours of cell c are indices[offsets[c]:offsets[c + 1]] (CSR layout)
+class Geometry:
+    # Relative positions of the 8 cells surrounding a center cell
+    STEPS = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
 
-# Utility function returns positions of valid adjacent cells
-def near(pos, ALL_LOCS):
-    # Create a set all cell positions around center (not including it)
-    around = set([(i, j) for i in range(pos[0]-1, pos[0]+2) for j in range(pos[1]-1, pos[1]+2)]) - {tuple(pos)}
-    # Only return the positions which intersect with valid positions
-    return around & ALL_LOCS
+    def __init__(self, H, W):
+        self.H = H
+        self.W = W
+        self.size = H * W
+
+        rows, cols = np.divmod(np.arange(self.size), W)
+        # One column per step, invalid (off board) neighbours are masked out afterwards
+        table = np.empty((self.size, len(self.STEPS)), dtype=np.int32)
+        valid = np.empty(table.shape, dtype=bool)
+        for k, (di, dj) in enumerate(self.STEPS):
+            r, c = rows + di, cols + dj
+            valid[:, k] = (r >= 0) & (r < H) & (c >= 0) & (c < W)
+            table[:, k] = r * W + c
+
+        self.indices = table[valid] # Row major masking keeps each cell's neighbours contiguous
+        self.offsets = np.zeros(self.size + 1, dtype=np.int32)
+        np.cumsum(valid.sum(axis=1), out=self.offsets[1:])
+
+    # Linear indices of the cells around cell (a view into the table, nothing is allocated)
+    def near(self, cell):
+        return self.indices[self.offsets[cell]:self.offsets[cell + 1]]
+
+    # Linear indices of the cells around every cell of an array, concatenated
+    def around(self, cells):
+        starts, ends = self.offsets[cells], self.offsets[cells + 1]
+        counts = ends - starts
+        # Position k of the output reads indices[starts[j] + k - (first output position of j)]
+        shift = np.repeat(starts - np.cumsum(counts) + counts, counts)
+        return self.indices[shift + np.arange(int(counts.sum()))]
+
+    # (row, column) position of a linear cell index
+    def pos(self, cell):
+        return divmod(int(cell), self.W)
+
+# Geometries are cached by board size so repeated solves on the same H x W share the table
+# (only the most recently used sizes are kept, a stream of boards of every size stays bounded)
+@lru_cache(maxsize=8)
+def geometry(H, W):
+    return Geometry(H, W)
+
+# Compact board encoding: revealed numbers are stored as their value (0-8)
+UNKNOWN = -1
+MINE = -2
+CELL_CODES = {"?": UNKNOWN, "x": MINE, "*": MINE, **{str(k): k for k in range(9)}}
+SYMBOLS = np.array(["x", "?"] + [str(k) for k in range(9)]) # Indexed by code + 2
+
+# Byte level lookup tables used to convert rows without going through Python strings
+INVALID = -128
+BYTE_CODES = np.full(256, INVALID, dtype=np.int8) # ASCII byte -> cell code
+for symbol, code in CELL_CODES.items():
+    BYTE_CODES[ord(symbol)] = code
+SYMBOL_BYTES = np.frombuffer("".join(SYMBOLS).encode(), dtype=np.uint8) # Indexed by code + 2
+
+# Read one board from a stream (path, text or binary file), one row at a time straight into an int8 board
+# The board ends at the first blank line or at the end of the stream. Returns None if there are no rows left
+def read_board(stream):
+    if isinstance(stream, str):
+        with io.open(stream, "rb") as file:
+            return read_board(file)
+
+    data = bytearray()
+    W = None
+    for line in stream:
+        line = line.strip()
+        if not line:
+            if W is None:
+                continue # Skip blank lines before the board
+            break
+        if isinstance(line, str):
+            line = line.encode()
+        symbols = np.frombuffer(line, dtype=np.uint8)
+        codes = BYTE_CODES[symbols[::2]]
+        if W is None:
+            W = len(codes)
+        if (len(line) != 2 * W - 1) | (codes == INVALID).any() | (symbols[1::2] != ord(" ")).any():
+            raise ValueError(f"Malformed board row {len(data) // W}: {line[:40]!r}")
+        data += codes.tobytes()
+
+    if W is None:
+        return None
+    return np.frombuffer(data, dtype=np.int8).reshape(-1, W) # Writable, as the bytearray is
+
+# Read every board of a stream, boards being separated by blank lines
+def read_boards(stream):
+    while (board := read_board(stream)) is not None:
+        yield board
+
+# Write an int8 board to a stream (text or binary file) one row at a time, followed by end
+def write_board(board, stream, end="\n"):
+    text = isinstance(stream, io.TextIOBase)
+    line = np.full(2 * board.shape[1], ord("\n"), dtype=np.uint8)
+    line[1:-1:2] = ord(" ")
+    for r, row in enumerate(board):
+        line[0::2] = SYMBOL_BYTES[row + 2]
+        chunk = line.tobytes() if r < len(board) - 1 else line[:-1].tobytes() + end.encode()
+        stream.write(chunk.decode() if text else chunk)
+
+# Parse a space separated board string into an int8 board
+def parse_board(map):
+    return read_board(io.StringIO(map))
+
+# Format an int8 board back into the space separated string representation
+def format_board(board):
+    stream = io.StringIO()
+    write_board(board, stream, end="")
+    return stream.getvalue()
+
+# Binary board file: 16 byte header (magic, H, W, mines) then cells packed two per byte,
+# each as its code + 2 in a nibble (high nibble first, padded to a whole byte)
+MAGIC = b"MSB1"
+HEADER = struct.Struct("<4sIII")
+
+# Cells of an int8 board packed two per byte (see the binary format)
+def pack_cells(board):
+    nibbles = (np.asarray(board, dtype=np.int8).reshape(-1) + 2).astype(np.uint8)
+    if len(nibbles) % 2:
+        nibbles = np.append(nibbles, np.uint8(0))
+    return (nibbles[0::2] << 4) | nibbles[1::2]
+
+# Save an int8 board in the binary format, n defaults to the number of mines on the board
+def save_board(path, board, n=None):
+    board = np.asarray(board, dtype=np.int8)
+    n = int((board == MINE).sum()) if n is None else n
+    with io.open(path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, board.shape[0], board.shape[1], n))
+        file.write(pack_cells(board).tobytes())
+
+# Board stored in the binary format, memory mapped: nothing is read until cells are asked for
+# mode: memmap mode, "c" gives a private copy on write board which set can change (the file is
+# never written, changed pages are kept in memory)
+class PackedBoard:
+    def __init__(self, path, mode="r"):
+        with io.open(path, "rb") as file:
+            magic, self.H, self.W, self.n = HEADER.unpack(file.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a binary board file")
+        self.path = path
+        self.shape = (self.H, self.W)
+        self.data = np.memmap(path, dtype=np.uint8, mode=mode, offset=HEADER.size, shape=((self.H * self.W + 1) // 2,))
+
+    # Packed board held in memory, from an int8 board
+    @classmethod
+    def from_board(cls, board, n=None):
+        packed = cls.__new__(cls)
+        packed.path = None
+        packed.H, packed.W = packed.shape = board.shape
+        packed.n = int((board == MINE).sum()) if n is None else n
+        packed.data = pack_cells(board)
+        return packed
+
+    # Change the codes of the cells at the given (distinct) linear indices
+    def set(self, indices, codes):
+        indices = np.asarray(indices, dtype=np.intp)
+        nibbles = (np.asarray(codes, dtype=np.int8) + 2).astype(np.uint8)
+        # Even and odd cells apart, so two cells of the same byte are never written at once
+        for odd in (0, 1):
+            pick = (indices & 1) == odd
+            at = indices[pick] >> 1
+            if odd:
+                self.data[at] = (self.data[at] & 0xF0) | nibbles[pick]
+            else:
+                self.data[at] = (self.data[at] & 0x0F) | (nibbles[pick] << 4)
+
+    # Codes of the cells at the given linear indices
+    def cells(self, indices):
+        indices = np.asarray(indices, dtype=np.intp)
+        packed = self.data[indices >> 1]
+        return (np.where(indices & 1, packed & 0xF, packed >> 4).astype(np.int8) - 2)
+
+    # Unpack rows [start, stop) into an int8 board
+    # (straight from the bytes holding them, high nibbles to the even cells and low ones to the odd)
+    def rows(self, start=0, stop=None):
+        stop = self.H if stop is None else stop
+        first, last = start * self.W, stop * self.W
+        data = self.data[first >> 1:(last + 1) >> 1]
+        codes = np.empty(2 * len(data), dtype=np.int8)
+        codes[0::2] = data >> 4
+        codes[1::2] = data & 0xF
+        codes -= 2
+        return codes[first & 1:(first & 1) + last - first].reshape(-1, self.W)
+
+    # Unpack the whole board
+    def unpack(self):
+        return self.rows()
+
+# Sum a boolean mask over the 8 neighbours of every cell (shifted slices of a zero padded copy)
+def neighbour_sum(mask):
+    H, W = mask.shape
+    padded = np.zeros((H + 2, W + 2), dtype=np.int8)
+    padded[1:-1, 1:-1] = mask
+    total = np.zeros((H, W), dtype=np.int8)
+    for di, dj in Geometry.STEPS:
+        total += padded[1 + di:H + 1 + di, 1 + dj:W + 1 + dj]
+    return total
+
+# First level logic over the whole board in one array operation
+# where: optional mask of the revealed cells allowed to be used as constraints
+# Returns masks of unknowns which are safe to open and unknowns which have to be mines
+def first_level(board, where=None):
+    unknown = board == UNKNOWN
+    revealed = board >= 0 if where is None else (board >= 0) & where
+    mines = neighbour_sum(board == MINE) # Adjacent tagged mines
+    unknowns = neighbour_sum(unknown) # Adjacent unknowns
+
+    # Cells whose tagged mines already match their number - the rest of their unknowns are safe
+    saturated = revealed & (board == mines) & (unknowns > 0)
+    # Cells whose unknowns are all needed to reach their number - those unknowns are mines
+    full = revealed & (board == mines + unknowns) & (unknowns > 0)
+
+    return unknown & (neighbour_sum(saturated) > 0), unknown & (neighbour_sum(full) > 0)
+
+# Build the constraints of the frontier: each revealed cell gives the set of unknowns around it
+# and how many mines are left to place amongst them. Identical sets are only kept once
+def constraints(flat, geo, frontier):
+    rules = {}
+    for cell in frontier:
+        adjacent = geo.near(cell).tolist()
+        unknowns = frozenset(pos for pos in adjacent if flat[pos] == UNKNOWN)
+        if unknowns:
+            rules[unknowns] = int(flat[cell]) - len([pos for pos in adjacent if flat[pos] == MINE])
+    return rules
+
+# Compare every pair of overlapping constraints (found through an index keyed by unknown cell)
+# If B needs as many mines outside of A as it has cells there, after A places all of its mines in
+# the overlap, then B's cells outside of A are all mines and A's cells outside of B are all safe.
+# This covers the 1-1 (subset) and 1-2 patterns, and any larger ones
+# Returns sets of safe cells and mine cells
+def subset_deductions(rules):
+    index = {} # Unknown cell -> constraints containing it
+    for cells in rules:
+        for pos in cells:
+            index.setdefault(pos, []).append(cells)
+
+    safe, mines = set(), set()
+    for a, countA in rules.items():
+        overlapping = set(b for pos in a for b in index[pos]) - {a}
+        for b in overlapping:
+            onlyB = b - a
+            if rules[b] - len(onlyB) == countA:
+                mines |= onlyB
+                safe |= a - b
+    return safe, mines
+
+# Local pattern table: deductions of three numbers in a row (or column) over the unknowns around
+# them, a 3x5 window centred on the middle number. Windows are keyed by which of their 12 other
+# cells are unknown (bit k for PATTERN_WINDOW[k]) and the mines still missing around each of the
+# three numbers: key = unknowns | left << 12 | center << 16 | right << 20.
+# Every key is solved exhaustively ahead of time (build_patterns), only those deducing more than
+# first level logic does are kept, and only once per symmetry class (left/right and up/down
+# mirrors, columns being the transpose of rows). The table ships as PATTERN_FILE, regenerated
+# with save_patterns(), and looking a window up replaces solving it
+PATTERN_WINDOW = [(r, c) for r in (-1, 0, 1) for c in range(-2, 3) if (r != 0) | (abs(c) == 2)]
+PATTERN_MAGIC = b"MSP1"
+PATTERN_HEADER = struct.Struct("<4sI")
+PATTERN_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "patterns.bin")
+
+# Window mask of the cells around a window position
+def window_near(r, c):
+    return sum(1 << k for k, (i, j) in enumerate(PATTERN_WINDOW) if (abs(i - r) <= 1) & (abs(j - c) <= 1))
+
+# Move the bits of a window mask (int or uint32 array) through a symmetry of the window positions
+def window_map(mask, symmetry):
+    mapped = 0
+    for k, (r, c) in enumerate(PATTERN_WINDOW):
+        mapped = mapped | (((mask >> k) & 1) << PATTERN_WINDOW.index(symmetry(r, c)))
+    return mapped
+
+# The 4 symmetries of a row window: mask transform, and whether the left and right numbers swap
+PATTERN_SYMMETRIES = [(lambda r, c: (r, c), False), (lambda r, c: (r, -c), True), (lambda r, c: (-r, c), False), (lambda r, c: (-r, -c), True)]
+
+# Key and deductions (mines | safe << 12) of a window under a symmetry
+def pattern_map(key, value, symmetry):
+    symmetry, swap = symmetry
+    unknowns, left, center, right = key & 0xFFF, (key >> 12) & 0xF, (key >> 16) & 0xF, key >> 20
+    if swap:
+        left, right = right, left
+    key = window_map(unknowns, symmetry) | (left << 12) | (center << 16) | (right << 20)
+    return key, window_map(value & 0xFFF, symmetry) | (window_map(value >> 12, symmetry) << 12)
+
+# Solve every window by enumerating all mine placements of its unknowns
+# Returns the canonical table as sorted key and deduction arrays
+def build_patterns():
+    around = [window_near(0, -1), window_near(0, 0), window_near(0, 1)]
+    table = set()
+    for unknowns in range(1 << len(PATTERN_WINDOW)):
+        # Cells which are mines (and, or) in every placement, by mines needed around each number
+        seen = {}
+        mines = unknowns
+        while True:
+            counts = tuple((mines & cells).bit_count() for cells in around)
+            both = seen.get(counts, (mines, mines))
+            seen[counts] = (both[0] & mines, both[1] | mines)
+            if not mines:
+                break
+            mines = (mines - 1) & unknowns
+        for (left, center, right), (always, ever) in seen.items():
+            # Leave out what first level logic finds by itself
+            easy = 0
+            for cells, count in zip(around, (left, center, right)):
+                if (count == 0) | (count == (unknowns & cells).bit_count()):
+                    easy |= unknowns & cells
+            mines, safe = always, unknowns & ~ever
+            if (mines | safe) & ~easy:
+                key = unknowns | (left << 12) | (center << 16) | (right << 20)
+                value = mines | (safe << 12)
+                table.add(min(pattern_map(key, value, symmetry) for symmetry in PATTERN_SYMMETRIES))
+    keys, values = zip(*sorted(table))
+    return np.array(keys, dtype=np.uint32), np.array(values, dtype=np.uint32)
+
+# Write the canonical table: header (magic, entries) then the keys and deductions as uint32
+def save_patterns(path=PATTERN_FILE):
+    keys, values = build_patterns()
+    with io.open(path, "wb") as file:
+        file.write(PATTERN_HEADER.pack(PATTERN_MAGIC, len(keys)))
+        file.write(keys.astype("<u4").tobytes())
+        file.write(values.astype("<u4").tobytes())
+
+# The full lookup table (every symmetry of every canonical window) as sorted key and deduction
+# arrays, loaded once. Built in memory when the shipped file is missing
+@lru_cache(maxsize=None)
+def pattern_table():
+    try:
+        with io.open(PATTERN_FILE, "rb") as file:
+            magic, entries = PATTERN_HEADER.unpack(file.read(PATTERN_HEADER.size))
+            if magic != PATTERN_MAGIC:
+                raise ValueError(f"{PATTERN_FILE} is not a pattern table")
+            keys = np.frombuffer(file.read(4 * entries), dtype="<u4")
+            values = np.frombuffer(file.read(4 * entries), dtype="<u4")
+    except FileNotFoundError:
+        keys, values = build_patterns()
+    keys, values = zip(*[pattern_map(keys.astype(np.uint32), values.astype(np.uint32), symmetry) for symmetry in PATTERN_SYMMETRIES])
+    keys, first = np.unique(np.concatenate(keys), return_index=True)
+    return keys, np.concatenate(values)[first]
+
+# Look up the windows of the given revealed cells (linear indices), along rows and columns
+# Returns sets of safe cells and mine cells
+def pattern_deductions(board, cells):
+    safe, mines = set(), set()
+    if not cells:
+        return safe, mines
+    keys, values = pattern_table()
+    H, W = board.shape
+    # Two cells of padding, off board cells are neither unknown nor numbers
+    padded = np.full((H + 4, W + 4), MINE, dtype=np.int8)
+    padded[2:-2, 2:-2] = board
+    left = np.zeros(padded.shape, dtype=np.uint32) # Mines still missing around each number
+    left[2:-2, 2:-2] = np.where(board >= 0, board - neighbour_sum(board == MINE), 0)
+    rows, cols = np.divmod(np.asarray(cells), W)
+    rows, cols = rows + 2, cols + 2
+
+    for transpose in (False, True):
+        at = (lambda r, c: (rows + c, cols + r)) if transpose else (lambda r, c: (rows + r, cols + c))
+        key = np.zeros(len(cells), dtype=np.uint32)
+        for k, (r, c) in enumerate(PATTERN_WINDOW):
+            key |= (padded[at(r, c)] == UNKNOWN).astype(np.uint32) << k
+        key |= (left[at(0, -1)] << 12) | (left[at(0, 0)] << 16) | (left[at(0, 1)] << 20)
+
+        index = np.minimum(np.searchsorted(keys, key), len(keys) - 1)
+        hit = (keys[index] == key) & (padded[at(0, -1)] >= 0) & (padded[at(0, 1)] >= 0) & (key & 0xFFF > 0)
+        found = values[index[hit]]
+        for k, (r, c) in enumerate(PATTERN_WINDOW):
+            r, c = at(r, c)
+            positions = (r[hit] - 2) * W + (c[hit] - 2)
+            mines.update(positions[(found >> k) & 1 > 0].tolist())
+            safe.update(positions[(found >> (k + 12)) & 1 > 0].tolist())
+    return safe, mines
+
+# Split constraints into independent groups which share no unknown cell
+# Returns a list of (cells, rules) pairs, rules being a list of (cells, mines) constraints
+def components(rules):
+    index = {} # Unknown cell -> constraints containing it
+    for cells in rules:
+        for pos in cells:
+            index.setdefault(pos, []).append(cells)
+
+    groups = []
+    seen = set()
+    for start in rules:
+        if start in seen:
+            continue
+        seen.add(start)
+        stack, group, cells = [start], [], set()
+        while stack:
+            rule = stack.pop()
+            group.append((rule, rules[rule]))
+            cells |= rule
+            for pos in rule:
+                for other in index[pos]:
+                    if other not in seen:
+                        seen.add(other)
+                        stack.append(other)
+        groups.append((sorted(cells), group))
+    return groups
+
+# Raised by the enumeration when the deadline of a solve passes
+class BudgetExhausted(Exception):
+    pass
+
+# Search steps allowed to enumerate one component, past it the component is given up on (large
+# components can have exponentially many placements)
+ENUMERATION_LIMIT = 1 << 18
+
+# Enumerate every valid mine placement of one component with pruned backtracking
+# Returns {mines used: [number of solutions, per cell number of solutions where it is a mine]},
+# or None when it takes more than limit search steps
+# deadline: perf_counter time after which BudgetExhausted is raised (checked every 4096 steps)
+def enumerate_component(cells, rules, limit=ENUMERATION_LIMIT, deadline=None):
+    position = {cell: k for k, cell in enumerate(cells)}
+    need = [count for _, count in rules] # Mines each constraint still needs
+    left = [len(group) for group, _ in rules] # Unassigned cells in each constraint
+    watching = [[] for _ in cells] # Constraints each cell belongs to
+    for j, (group, _) in enumerate(rules):
+        for pos in group:
+            watching[position[pos]].append(j)
+
+    N = len(cells)
+    value = [-1] * N # Last value tried on each cell
+    applied = [False] * N
+    table = {}
+
+    # Iterative depth first search (components can be deeper than the recursion limit)
+    k = 0
+    steps = 0
+    while k >= 0:
+        steps += 1
+        if steps > limit:
+            return None
+        if (deadline is not None) and (not steps % 4096) and (perf_counter() > deadline):
+            raise BudgetExhausted()
+        if k == N:
+            mines = sum(value)
+            entry = table.setdefault(mines, [0, [0] * N])
+            entry[0] += 1
+            entry[1] = [a + b for a, b in zip(entry[1], value)]
+            k -= 1
+            continue
+
+        # Undo the previous value before trying the next one
+        if applied[k]:
+            for j in watching[k]:
+                need[j] += value[k]
+                left[j] += 1
+            applied[k] = False
+        if value[k] == 1:
+            value[k] = -1
+            k -= 1
+            continue
+        value[k] += 1
+
+        # Every constraint must still be able to reach its count exactly
+        v = value[k]
+        if all((need[j] - v >= 0) & (need[j] - v <= left[j] - 1) for j in watching[k]):
+            for j in watching[k]:
+                need[j] -= v
+                left[j] -= 1
+            applied[k] = True
+            k += 1
+
+    # Frozen so the table can be shared through the signature cache
+    return {mines: (count, tuple(perCell)) for mines, (count, perCell) in table.items()}
+
+# Canonical signature of a component: its constraints over cells relabelled by rank (position in
+# the sorted cell list). Components equal up to translation, on any board, share a signature
+def signature(cells, rules):
+    rank = {cell: k for k, cell in enumerate(cells)}
+    return (len(cells), tuple(sorted((tuple(sorted(rank[pos] for pos in group)), count) for group, count in rules)))
+
+# Solved component signatures, shared across iterations and boards (least recently used dropped)
+# signature -> (enumeration table, forced cells), both None for components too large to enumerate
+# The lock guards lookups and evictions, solves running in threads (see solve_async) share the cache
+SIGNATURES = OrderedDict()
+SIGNATURE_CACHE = 4096
+SIGNATURES_LOCK = threading.Lock()
+
+# Enumerate a component signature once and work out the cells it forces (see forced_signature)
+# deadline only bounds a first enumeration, nothing is cached when it runs out
+def solve_signature(sig, deadline=None):
+    with SIGNATURES_LOCK:
+        if sig in SIGNATURES:
+            SIGNATURES.move_to_end(sig)
+            return SIGNATURES[sig]
+    N, rules = sig
+    table = enumerate_component(list(range(N)), [(frozenset(group), count) for group, count in rules], deadline=deadline)
+    forced = None
+    if table is not None:
+        safe = tuple(k for k in range(N) if all(perCell[k] == 0 for _, perCell in table.values()))
+        mines = tuple(k for k in range(N) if all(perCell[k] == count for count, perCell in table.values()))
+        forced = safe, mines, {used: count for used, (count, _) in table.items()}
+    with SIGNATURES_LOCK:
+        SIGNATURES[sig] = table, forced
+        if len(SIGNATURES) > SIGNATURE_CACHE:
+            SIGNATURES.popitem(last=False)
+    return table, forced
+
+# Memoized enumeration of a component signature (None for components too large to enumerate)
+def count_signature(sig, deadline=None):
+    return solve_signature(sig, deadline)[0]
+
+# Cells of a component signature which are safe/mines in every valid placement, whatever the rest
+# of the board holds, with its number of placements by mines used ({mines: solutions}).
+# Cached per signature, so a recurring shape (a 1-2-1 wall, a 1-1 corner...) is only solved once
+# None for components too large to enumerate
+def forced_signature(sig, deadline=None):
+    return solve_signature(sig, deadline)[1]
+
+# Components larger than this go through subset_deductions instead of being enumerated
+COMPONENT_LIMIT = 24
+
+# Second level logic component by component: every independent group of constraints small enough
+# is looked up (or solved once) by signature and its forced cells mapped back onto the board
+# deadline: perf_counter time after which BudgetExhausted is raised
+# Returns sets of safe cells and mine cells
+def component_deductions(rules, limit=COMPONENT_LIMIT, deadline=None):
+    safe, mines = set(), set()
+    large = {}
+    for cells, group in components(rules):
+        if (deadline is not None) and (perf_counter() > deadline):
+            raise BudgetExhausted()
+        forced = None if len(cells) > limit else forced_signature(signature(cells, group), deadline)
+        if forced is None:
+            large.update(group)
+            continue
+        forcedSafe, forcedMines, _ = forced
+        safe.update(cells[k] for k in forcedSafe)
+        mines.update(cells[k] for k in forcedMines)
+    if large:
+        largeSafe, largeMines = subset_deductions(large)
+        safe |= largeSafe
+        mines |= largeMines
+    return safe, mines
+
+# Add up mine count distributions ({mines: ways}) of independent components
+def convolve(dists):
+    total = {0: 1}
+    for dist in dists:
+        merged = {}
+        for a, x in total.items():
+            for b, y in dist.items():
+                merged[a + b] = merged.get(a + b, 0) + x * y
+        total = merged
+    return total
+
+# Number of ways to place the mines left over in the interior (unknowns touching no number)
+def interior_ways(interior, mines):
+    return comb(interior, mines) if 0 <= mines <= interior else 0
+
+# Weigh every frontier cell by the number of full board solutions in which it is a mine,
+# combining components under the global number of mines remaining
+# Returns (total solutions, {cell: mine solutions}, mine solutions of any one interior cell), or
+# None when a component is too large to enumerate (see ENUMERATION_LIMIT)
+# deadline: perf_counter time after which BudgetExhausted is raised
+# approximate: instead of giving up, drop the constraints of components too large to enumerate and
+#   count their cells as interior ones (they get no weight of their own and share the interior's)
+def solution_weights(rules, remaining, interior, deadline=None, approximate=False):
+    groups = []
+    for cells, group in components(rules):
+        table = count_signature(signature(cells, group), deadline)
+        if table is not None:
+            groups.append((cells, table))
+        elif approximate:
+            interior += len(cells)
+        else:
+            return None
+    dists = [{k: entry[0] for k, entry in table.items()} for _, table in groups]
+
+    # Distributions of the components before and after each one, so that combining all the others
+    # costs a single convolution per component
+    before = [{0: 1}]
+    for dist in dists:
+        before.append(convolve([before[-1], dist]))
+    after = [{0: 1}]
+    for dist in reversed(dists):
+        after.append(convolve([after[-1], dist]))
+    after.reverse()
+
+    # Ways of filling the interior, by mines left for it (big binomials, each worked out once)
+    fill = {}
+    def ways(mines):
+        if mines not in fill:
+            fill[mines] = interior_ways(interior, mines)
+        return fill[mines]
+
+    weights = {}
+    for c, (cells, table) in enumerate(groups):
+        others = convolve([before[c], after[c + 1]])
+        for k, (count, perCell) in table.items():
+            completions = sum(x * ways(remaining - k - j) for j, x in others.items())
+            for cell, mine in zip(cells, perCell):
+                weights[cell] = weights.get(cell, 0) + mine * completions
+
+    everything = before[-1]
+    total = sum(x * ways(remaining - k) for k, x in everything.items())
+    # Solutions with a given interior cell as a mine: place the other mines in the rest of the interior
+    interiorWeight = sum(x * interior_ways(interior - 1, remaining - k - 1) for k, x in everything.items()) if interior else 0
+    return total, weights, interiorWeight
+
+# Probability of every cell being a mine, over all solutions consistent with the board and the
+# total number of mines n. Revealed cells are 0, tagged mines are 1
+# Components too large to enumerate (see ENUMERATION_LIMIT) are approximated: their constraints are
+# left out, so their cells get the same probability as the interior cells
+def mine_probabilities(board, n):
+    geo = geometry(*board.shape)
+    flat = board.reshape(-1)
+    unknown = board == UNKNOWN
+    frontier = np.flatnonzero((board >= 0) & (neighbour_sum(unknown) > 0)).tolist()
+    rules = constraints(flat, geo, frontier)
+    interior = int(unknown.sum()) - len(frozenset().union(*rules))
+    total, weights, interiorWeight = solution_weights(rules, n - int((board == MINE).sum()), interior, approximate=True)
+
+    probabilities = np.where(board == MINE, 1, 0).astype(np.float32)
+    if total:
+        probabilities[unknown] = interiorWeight / total
+        for cell, weight in weights.items():
+            probabilities.flat[cell] = weight / total
+    return probabilities
+
+# Mutable state of a solve, kept as flat masks indexed by cell id: one byte per cell for each of
+# them whatever the board size, and set operations between them are whole array operations
+class SolverState:
+    __slots__ = ("board", "flat", "resolved", "frontier", "queued", "dirty", "foundMines")
+
+    def __init__(self, board):
+        self.board = board
+        self.flat = board.reshape(-1) # Linear view of the board, indexed by cell id
+        self.resolved = self.flat == MINE # Cells which have been resolved and can be ignored (starting with the mines tagged on the map)
+        self.frontier = np.zeros(self.flat.size, dtype=bool) # Revealed cells which still have unknowns around them
+        self.queued = np.zeros(self.flat.size, dtype=bool) # Cells currently waiting in the work queue
+        self.dirty = deque() # Work queue of revealed cells whose neighbourhood changed
+        self.foundMines = int(self.resolved.sum())
 
 # Solve minesweeper game
-def solve_mine(map, n):
-    # Store board data in a list
-    board = np.array([row.split(' ') for row in map.split("\n")])
+# oracle: game to open cells on (see Oracle), defaults to the kata's open function (see kata_oracle)
+# batched: run first level logic as whole board array operations instead of through the work queue
+# probabilities: when stuck return the mine probability map of the board instead of "?"
+# trace: Trace receiving the solver's events, nothing is recorded or formatted without one
+# raw: return the solved int8 board instead of its string (e.g. to stream it out with write_board)
+# stats: Stats filled with the time and work of every phase of the solve
+# max_steps, time_limit: optional budgets (main loop iterations, seconds). When one runs out the
+#   partial board is returned, with everything deduced so far and '?' on the cells still unknown
+def solve_mine(map, n, oracle=None, batched=False, probabilities=False, trace=None, raw=False, stats=None, max_steps=None, time_limit=None):
+    # Store board data as a compact int8 array (map can also be given already encoded)
+    if isinstance(map, PackedBoard):
+        board = map.unpack()
+    else:
+        board = parse_board(map) if isinstance(map, str) else np.array(map, dtype=np.int8)
 
     # Tools and constants
     H = len(board) # Height
     W = len(board[0]) # Width
-    ALL_LOCS = set([(i, j) for i in range(H) for j in range(W)]) # All valid positions
+    geo = geometry(H, W) # Shared neighbour table for this board size
+    oracle = oracle or kata_oracle()
+    trace = trace or NO_TRACE
 
     # Variables
-    resolved = set() # Positions which have been resolved and can be ignored
-    opened = set() # Opened positions
-    foundMines = 0
+    state = SolverState(board)
+    flat, resolved, frontier, queued, dirty = state.flat, state.resolved, state.frontier, state.queued, state.dirty
+    deadline = None if time_limit is None else perf_counter() + time_limit
+    exhausted = False # A budget ran out before reaching a fixed point
 
-    if DEBUG: fancyPrint(board, resolved)
+    def out_of_time():
+        return (deadline is not None) and (perf_counter() > deadline)
 
-    MAX_LOOPS = 20
-    didSomething = True
+    # Queue cells and their revealed neighbours to be re-evaluated
+    # (batched solves rebuild the frontier from the board masks instead and never use the queue)
+    def touch(cells):
+        if stats: stats.pending["near"] += len(cells)
+        cells = np.asarray(cells, dtype=np.intp)
+        around = np.concatenate((cells, geo.around(cells)))
+        around = around[(flat[around] >= 0) & ~queued[around]]
+        queued[around] = True
+        dirty.extend(dict.fromkeys(around.tolist()))
 
-    i = 0
-    # Iterate while more mines to find or board not fully revelead, and not stuck in infinite loop
-    while (foundMines != n) & (i < MAX_LOOPS) & didSomething:
-        didSomething = False
+    # Open cells with a single oracle call and queue their neighbourhoods
+    # reason (and the source cell it comes from) is only used for tracing
+    # Returns the cells which were actually opened
+    def uncover(cells, reason, source=None):
+        cells = [cell for cell in dict.fromkeys(cells) if flat[cell] == UNKNOWN]
+        if cells:
+            flat[cells] = [int(value) for value in oracle.open_many([geo.pos(cell) for cell in cells])]
+            if not batched:
+                touch(cells)
+            if stats: stats.pending["opened"] += len(cells)
+            if trace.level >= STEPS: trace.step(i, "open", [geo.pos(cell) for cell in cells], flat[cells].tolist(), reason, None if source is None else geo.pos(source))
+        return cells
 
-        ## Reveal cells around '0' cells
-        for cell in set(tuple(pos) for pos in np.argwhere(board == "0")) - resolved:
-            resolved.add(tuple(cell))
-            for adjacent in near(cell, ALL_LOCS) - resolved - opened:
-                board[adjacent] = open(*adjacent)
-                opened.add(adjacent)
-                if DEBUG: print(f"[{i}] Opened {adjacent} thanks to 0 cell")
-                didSomething = True
+    # Open cells, flooding the '0' regions they uncover
+    def reveal(cells, reason, source=None):
+        cells = uncover(cells, reason, source)
+        flood([cell for cell in cells if flat[cell] == 0])
 
-        if DEBUG: fancyPrint(board, resolved)
+    # Open whole connected regions of '0' cells and their numbered border, one ring per oracle call
+    # (iterative breadth first search so large empty regions can't overflow the stack)
+    def flood(zeros):
+        nonlocal exhausted
+        while zeros:
+            if out_of_time():
+                exhausted = True # The zero cells left stay queued, the partial board is still valid
+                return
+            if stats: stats.pending["near"] += len(zeros)
+            ring = uncover([pos for cell in zeros for pos in geo.near(cell).tolist()], "0 region flood")
+            zeros = [cell for cell in ring if flat[cell] == 0]
 
-        ## Mark mine positions using first level logic
-        mines = set()
-        for cell in set(tuple(pos) for pos in np.argwhere(board != "?")) - resolved:
-            adjacent = near(cell, ALL_LOCS)
-            marked = set([pos for pos in adjacent if board[pos] == "*"])
-            unknown = set([pos for pos in adjacent if board[pos] == "?"])
+    # Tag cells as mines and queue their neighbourhoods
+    def flag(cells, reason, source=None):
+        cells = [cell for cell in dict.fromkeys(cells) if flat[cell] == UNKNOWN]
+        flat[cells] = MINE
+        state.foundMines += len(cells)
+        resolved[cells] = True
+        if (not batched) & bool(cells):
+            touch(cells)
+        if stats: stats.pending["marked"] += len(cells)
+        if (trace.level >= STEPS) & bool(cells): trace.step(i, "mark", [geo.pos(cell) for cell in cells], None, reason, None if source is None else geo.pos(source))
 
-            # No unknown cells around, the cell is resolved
-            if not len(unknown):
-                resolved.add(cell)
-            # Number of possible adjacent mines corresponds to number on center
-            elif (int(board[cell]) == len(marked | unknown)) & len(unknown - resolved):
-                foundMines += len(unknown - resolved)
-                mines |= unknown - resolved
-                resolved.add(cell) # Satisfied cells are resolved
-                resolved |= unknown  # Marked mines are resolved
-                if DEBUG: print(f"[{i}] Marking {unknown} thanks to 1st level logic from {cell}")
-                didSomething = True
+    # Every revealed cell starts out dirty
+    if not batched:
+        for cell in np.flatnonzero(flat >= 0).tolist():
+            queued[cell] = True
+            dirty.append(cell)
+
+    didSomething = True
+
+    i = 0
+    if trace.level >= BOARDS: trace.board(i, board, resolved)
+    # Iterate while more mines to find and the last iteration made progress (until a fixed point)
+    while (state.foundMines != n) & didSomething:
+        if ((max_steps is not None) and (i >= max_steps)) or out_of_time():
+            exhausted = True
+            break
+        didSomething = False
+        if stats: start = perf_counter()
 
-            # FOR DEBUGGING
-            # elif (int(board[cell]) < len(marked)):
-            #     print(f"[{i}] CELL {cell} OVERLOADED")
-            #     fancyPrint(board, resolved, [cell])
-            #     quit()
+        if batched:
+            ## Open cells around satisfied cells and mark mines using first level logic, all cells at once
+            while True:
+                safe, mines = first_level(board)
+                mines = np.flatnonzero(mines).tolist()
+                safe = np.flatnonzero(safe).tolist()
+                if not (mines or safe):
+                    break
+                flag(mines, "batched 1st level logic")
+                reveal(safe, "batched 1st level logic")
+                didSomething = True
+                # Every pass is a whole board operation, stop as soon as the budget runs out
+                if exhausted or out_of_time():
+                    exhausted = True
+                    break
 
-        # Apply mine positions
-        while mines:
-            board[mines.pop()] = "*"
+            # Rebuild the frontier from the masks, the work queue is not used in batched solves
+            revealed = flat >= 0
+            unknowns = neighbour_sum(board == UNKNOWN).reshape(-1)
+            resolved |= revealed & (unknowns == 0)
+            frontier[:] = revealed & (unknowns > 0)
+            if stats:
+                stats.pending["examined"] += geo.size
+                start = stats.lap("batched", start)
 
-        if DEBUG: fancyPrint(board, resolved)
+        ## First level logic, only re-evaluating cells whose neighbourhood changed
+        # '0' cells and cells with the right amount of mines tagged open their unknowns,
+        # cells which need all of their unknowns to be mines get them marked
+        examined = 0
+        opening = {} # Safe cells found while draining the queue, opened together when it runs dry
+        while dirty or opening:
+            # One oracle call for every cell the drain found safe, flooding all their '0' regions
+            # together; the cells around them are queued for the next drain
+            if not dirty:
+                reveal(list(opening), "satisfied cell")
+                opening.clear()
+                if stats: start = stats.lap("satisfied", start)
+                continue
 
-        ## Open all cells around those which have the right amount of mines tagged
-        for cell in set(tuple(pos) for pos in np.argwhere(board != "?")) - resolved:
-            adjacent = near(cell, ALL_LOCS)
-            tagged = len([pos for pos in adjacent if board[pos] == "*"])
+            # Check the clock every so often, large boards can spend a long time in here
+            examined += 1
+            if (not examined % 1024) and out_of_time():
+                exhausted = True
+                break
+            cell = dirty.popleft()
+            queued[cell] = False
+            adjacent = geo.near(cell).tolist()
+            unknown = [pos for pos in adjacent if flat[pos] == UNKNOWN]
 
-            # Number of adjacent tagged mines matches cell value
-            if int(board[cell]) == tagged:
-                for pos in [pos for pos in adjacent if board[pos] == "?"]:
-                    board[pos] = open(*pos)
-                    if DEBUG: print(f"[{i}] Opened {pos} thanks to satifed cell {cell}")
+            # No unknown cells around, the cell is resolved
+            if not unknown:
+                resolved[cell] = True
+                frontier[cell] = False
+            else:
+                frontier[cell] = True
+                tagged = len([pos for pos in adjacent if flat[pos] == MINE])
+                # Number of adjacent tagged mines matches cell value ('0' cells included)
+                if flat[cell] == tagged:
+                    opening.update(dict.fromkeys(unknown))
+                    didSomething = True
+                # Number of possible adjacent mines corresponds to number on center
+                elif flat[cell] == tagged + len(unknown):
+                    flag(unknown, "1st level logic", cell)
                     didSomething = True
 
-        if DEBUG: fancyPrint(board, resolved)
-
-        ## Select and open/mark cells using second level logic (1-1 and 1-2 patterns)
-        # 1-1 Pattern: If a current cell's mine count will be satisfied by all
-        # mine placement options from another cell - then we can safely open the rest
-        # Also selecting all effective 2 cells to use for 1-2 logic later
-        temp = np.copy(board).astype(np.dtype(list)) # Temporary board to mark cells
-        effectiveOnes = set() # Cells on which the 1-1 is going to be checked
-        effectiveTwos = set() # Cells on which the 1-2 is going to be checked
-        placed = {} # Dict tracks how many of each code was placed
-        for cell in set(tuple(pos) for pos in np.argwhere(board != "?")) - resolved:
-            adjacent = near(cell, ALL_LOCS)
-            mines = [pos for pos in adjacent if board[pos] == "*"]
-            unknowns = [pos for pos in adjacent if board[pos] == "?"]
-
-            # Effective value of cell is 1 and can not be solved using first level
-            # NOTE: could technically open cell - come back here when needing more speed
-            if (int(board[cell]) - len(mines) == 1) & (len(unknowns) != 1):
-                effectiveOnes.add(cell)
-                # Add unique codes to unknowns around cell to perform logic later
-                code = str(cell[0]) + str(cell[1])
-                placed[code] = len(unknowns) # To compare with Counter later
-                for pos in unknowns:
-                    if type(temp[pos]) == str:
-                        temp[pos] = [code]
-                    else:
-                        temp[pos] += [code]
-            # Effective value of cell is 2 and can not be solved using first level
-            if (int(board[cell]) - len(mines) == 2) & (len(unknowns) == 3):
-                effectiveTwos.add(cell)
-
-
-        # Process the effectiveOnes cells - open valid 1-1 patterns
-        opened = set()
-        for cell in effectiveOnes:
-            adjacent = near(cell, ALL_LOCS)
-            curr = str(cell[0]) + str(cell[1]) # Current cell code
-
-            # Fetch code lists surrounding the current cell
-            codes = [(temp[pos], pos) for pos in adjacent if type(temp[pos]) == list]
-            # Flatten and warp with Counter
-            count = Counter([code for pos in codes for code in pos[0]])
-            # (cell sees all placed codes from a cell) (that isnt itself) (that would lead to opening unknowns)
-            matches = [code for code in count.keys() if (count[code] == placed[code]) & (code != curr) & (count[code] < len(codes))]
-            # Open all cells which don't contain the matched codes
-            for match in matches:
-                for code in codes:
-                    if (not match in code[0]) & (not code[1] in opened):
-                        if DEBUG: print(f"[{i}] Opening {code[1]} thanks to 1-1 logic from {cell}")
-                        opened.add(code[1])
-                        board[code[1]] = open(*code[1])
-                        didSomething = True
+            if stats:
+                stats.pending["examined"] += 1
+                stats.pending["near"] += 1
+                start = stats.lap("first level", start)
 
-        if DEBUG: fancyPrint(board, resolved)
-
-        # Tag effectiveTwo cells which match the 1-2 pattern
-        for cell in effectiveTwos:
-            adjacent = near(cell, ALL_LOCS)
-            curr = str(cell[0]) + str(cell[1]) # Current cell code
-
-            # Fetch unknown that might have not been tagged in temp
-            unknown = [pos for pos in adjacent if temp[pos] == "?"]
-            # Fetch code lists surrounding the current cell
-            codes = [(temp[pos], pos) for pos in adjacent if type(temp[pos]) == list]
-            # Flatten and warp with Counter
-            count = Counter([code for pos in codes for code in pos[0]])
-            # (cell sees all placed codes from a cell) (that isnt itself) (that would lead to marking unknowns (num of unknowns is len(codes)))
-            matches = [code for code in count.keys() if (count[code] == placed[code]) & (code != curr)]
-
-            # Mark all cells which don't contain the matched codes
-            for match in matches:
-                for code in codes:
-                    if (not match in code[0]) & (not code[1] in resolved):
-                        foundMines += 1
-                        resolved.add(code[1])
-                        board[code[1]] = "*"
-                        if DEBUG: print(f"[{i}] Marking {code[1]} thanks to 1-2 logic from {cell}")
-                        didSomething = True
+        if trace.level >= BOARDS: trace.board(i, board, resolved)
+        if exhausted or out_of_time():
+            exhausted = True
+            break
 
-                # There's a match - the cell to mark has to be the only unknown
-                if len(unknown):
-                    if not unknown[0] in resolved:
-                        foundMines += 1
-                        resolved.add(unknown[0])
-                        board[unknown[0]] = "*"
-                        if DEBUG: print(f"[{i}] Marking {unknown[0]} thanks to 1-2 logic from {cell}")
-                        didSomething = True
-                        break
+        ## Local patterns: look the windows of three numbers in a row around frontier cells up
+        live = np.flatnonzero(frontier).tolist()
+        safe, mines = pattern_deductions(board, live)
+        flag(mines, "pattern table")
+        reveal(safe, "pattern table")
+        didSomething |= bool(safe or mines)
+        if stats:
+            stats.pending["examined"] += len(live)
+            start = stats.lap("patterns", start)
 
+        ## Second level logic: forced cells of every constraint component (1-1, 1-2 and larger patterns)
+        rules = constraints(flat, geo, live)
+        try:
+            safe, mines = component_deductions(rules, deadline=deadline)
+        except BudgetExhausted:
+            exhausted = True
+            break
+        flag(mines, "constraint component logic")
+        reveal(safe, "constraint component logic")
+        didSomething |= bool(safe or mines)
+        if stats:
+            stats.pending["examined"] += len(live)
+            stats.pending["near"] += len(live)
+            start = stats.lap("second level", start)
 
         # If number of unknowns equals remainder of mines - tag them
-        # NOTE: Using np.where here instead of argwhere will cause the count of '?' to be one less than reality for some reason...
-        unknowns = np.argwhere(board == "?")
-        if (len(unknowns) == n - foundMines) & bool(len(unknowns)):
-            foundMines += len(unknowns)
-            for cell in unknowns:
-                board[tuple(cell)] = "*"
-                resolved.add(tuple(cell))
-            if DEBUG: print(f"[{i}] Marked all remaining unknowns as they have to be mines")
+        unknowns = flat == UNKNOWN
+        left = int(unknowns.sum())
+        if (left == n - state.foundMines) & bool(left):
+            flag(np.flatnonzero(unknowns).tolist(), "remaining mine count")
 
         # If there's only one mine left, mark position which satisfies all unresolved cells
-        elif n - foundMines == 1:
-            unresolved = set(tuple(pos) for pos in np.argwhere(board != "?")) - resolved
-            codes = set([str(pos[0]) + str(pos[1]) for pos in unresolved])
-
-            # If a cell contains all codes from unresolved cells, its the final mine
-            for cell in unknowns:
-                if set(temp[tuple(cell)]) == codes:
-                    foundMines += 1
-                    resolved.add(tuple(cell))
-                    board[tuple(cell)] = "*"
-                    if DEBUG: print(f"[{i}] Marked last mine as it satifies all unresolved cells")
-
-        # TODO: Implement a guessing algorithm - makes initial mine guess and tests if branching decisions
-        #       make sense based on number of mines remaining
-
-        fancyPrint(board, resolved)
+        elif (n - state.foundMines == 1) & bool(rules) & (not (safe or mines)):
+            # The last mine has to be shared by every constraint still needing one
+            candidates = frozenset.intersection(*[cells for cells, count in rules.items() if count])
+            if len(candidates) == 1:
+                flag(candidates, "last mine satisfying all unresolved cells")
+        if stats: start = stats.lap("endgame", start)
+
+        ## Exact logic: enumerate every valid mine placement of the frontier when nothing else works
+        # (skipped when a component is too large to enumerate, see ENUMERATION_LIMIT)
+        if (not didSomething) & (state.foundMines != n) & bool(rules):
+            interior = left - len(frozenset().union(*rules)) # Unknowns touching no number
+            try:
+                total, weights, interiorWeight = solution_weights(rules, n - state.foundMines, interior, deadline) or (0, {}, 0)
+            except BudgetExhausted:
+                exhausted = True
+                break
+            if total:
+                mines = [cell for cell, weight in weights.items() if weight == total]
+                safe = [cell for cell, weight in weights.items() if weight == 0]
+                # Interior cells are interchangeable, they are all mines or all safe together
+                unknowns[list(weights)] = False
+                inside = np.flatnonzero(unknowns).tolist()
+                if interior and (interiorWeight == total):
+                    mines += inside
+                elif interior and (interiorWeight == 0):
+                    safe += inside
+                flag(mines, "exact enumeration (mine in every solution)")
+                reveal(safe, "exact enumeration (safe in every solution)")
+                didSomething |= bool(mines or safe)
+            if stats:
+                stats.pending["examined"] += len(rules)
+                start = stats.lap("exact", start)
+
+        if trace.level >= BOARDS: trace.board(i, board, resolved)
+        if stats: stats.iteration(i, len(live))
         i += 1
 
     # Game is over, just need to reveal remaining unknowns
-    if (foundMines == n):
-        unknowns = np.argwhere(board == "?")
-        for cell in unknowns:
-            cell = tuple(cell)
-            board[cell] = open(*cell)
-            resolved.add(cell)
-        if DEBUG: print(f"[{i}] Opened all remaining cells, all mines found")
+    if (state.foundMines == n):
+        if stats: start = perf_counter()
+        resolved[uncover(np.flatnonzero(flat == UNKNOWN).tolist(), "all mines found")] = True
+        if stats: stats.lap("endgame", start)
 
     # Handle exit condtions
-    if foundMines == n:
-        print(f"SUCCESS! Found {foundMines}/{n} mines after {i} iterations")
-        return "\n".join([' '.join(line) for line in board]).replace('*', "x")
+    if state.foundMines == n:
+        if stats: stats.status = "solved"
+        if trace.level >= SUMMARY: trace.result("solved", i, state.foundMines, n)
+        return board if raw else format_board(board)
 
-    if i == MAX_LOOPS:
-        print("Max Loops exceeded")
-        return "MAX LOOPS EXCEEDED"
+    if exhausted:
+        if stats: stats.status = "budget"
+        if trace.level >= SUMMARY: trace.result("budget", i, state.foundMines, n)
+        return board if raw else format_board(board)
 
     if not didSomething:
-        print(f"NoActionPerformed: Start of infinite looping caught - Aborted at {i} iterations")
-        print(f"{foundMines}/{n} mines were marked")
+        if stats: stats.status = "stuck"
+        if trace.level >= SUMMARY: trace.result("stuck", i, state.foundMines, n)
+        if probabilities:
+            return mine_probabilities(board, n)
         return "?"
 
+### Statistics
+# Work done by a solve: wall time (seconds) and counters for every phase, plus the progress of
+# every iteration of the main loop (to see why a board stops making progress or runs out of budget)
+# callback: called with (iteration, stats) at the end of every iteration
+class Stats:
+    COUNTERS = ("examined", "near", "opened", "marked") # Cells examined, neighbour lookups, cells opened, mines marked
+
+    def __init__(self, callback=None):
+        self.time = {}
+        self.counts = {}
+        self.pending = dict.fromkeys(self.COUNTERS, 0) # Counted since the last lap
+        self.totals = dict.fromkeys(self.COUNTERS, 0)
+        self.history = [] # Per iteration: cells opened, mines marked and frontier size
+        self.iterations = 0
+        self.status = None
+        self.callback = callback
+
+    # Add the time since start and the pending counters to a phase,
+    # returns the current time to start the next one from
+    def lap(self, phase, start):
+        now = perf_counter()
+        self.time[phase] = self.time.get(phase, 0) + now - start
+        counts = self.counts.setdefault(phase, dict.fromkeys(self.COUNTERS, 0))
+        for counter, value in self.pending.items():
+            counts[counter] += value
+            self.totals[counter] += value
+            self.pending[counter] = 0
+        return now
+
+    # Record the end of an iteration of the main loop
+    def iteration(self, i, frontier):
+        done = sum(entry["opened"] for entry in self.history), sum(entry["marked"] for entry in self.history)
+        self.history.append({"opened": self.totals["opened"] - done[0], "marked": self.totals["marked"] - done[1], "frontier": frontier})
+        self.iterations = i + 1
+        if self.callback:
+            self.callback(i, self)
+
+    # JSON serialisable summary
+    def as_dict(self):
+        return {"status": self.status, "iterations": self.iterations, "time": self.time, "counts": self.counts, "history": self.history}
+
+### Tracing
+# Trace levels, each one includes the ones before it
+OFF = 0
+SUMMARY = 1 # Outcome of every solve
+STEPS = 2 # Every batch of cells opened or marked, and why
+BOARDS = 3 # Board snapshot after every pass
+
+# Collects solver events (JSON serialisable dicts) into a sink, up to a level
+# The solver checks trace.level before building anything, so a disabled trace costs one comparison
+class Trace:
+    def __init__(self, sink=None, level=STEPS):
+        self.sink = sink
+        self.level = level if sink is not None else OFF
+
+    def step(self, iteration, action, cells, values, reason, source):
+        self.sink.emit({"event": action, "iteration": iteration, "cells": cells, "values": values, "reason": reason, "source": source})
+
+    # resolved: mask of the resolved cells, by cell id
+    def board(self, iteration, board, resolved):
+        self.sink.emit({"event": "board", "iteration": iteration, "board": format_board(board), "resolved": np.flatnonzero(resolved).tolist()})
+
+    def result(self, status, iterations, mines, n):
+        self.sink.emit({"event": "result", "status": status, "iterations": iterations, "mines": mines, "n": n})
+
+NO_TRACE = Trace()
+
+# Keeps the last capacity events in memory
+class RingSink:
+    def __init__(self, capacity=10000):
+        self.events = deque(maxlen=capacity)
+
+    def emit(self, event):
+        self.events.append(event)
+
+# Writes one JSON object per line to a file (path or open file object)
+# (json is imported on first use, plain solves never need it)
+class JSONLinesSink:
+    def __init__(self, file):
+        import json
+        self.dumps = json.dumps
+        self.file = io.open(file, "w") if isinstance(file, str) else file
+
+    def emit(self, event):
+        self.file.write(self.dumps(event) + "\n")
+
+    def close(self):
+        self.file.close()
+
+# Reads events back from a JSON lines trace file
+def read_trace(path):
+    import json
+    with io.open(path) as file:
+        return [json.loads(line) for line in file]
+
+# Prints events to the console, coloured boards included (the old DEBUG output)
+class ConsoleSink:
+    def emit(self, event):
+        if event["event"] == "board":
+            fancyPrint(parse_board(event["board"]), set(event["resolved"]))
+        elif event["event"] == "result":
+            if event["status"] == "solved":
+                print(f"SUCCESS! Found {event['mines']}/{event['n']} mines after {event['iterations']} iterations")
+            elif event["status"] == "budget":
+                print(f"Budget exhausted after {event['iterations']} iterations, {event['mines']}/{event['n']} mines were marked")
+            else:
+                print(f"NoActionPerformed: Start of infinite looping caught - Aborted at {event['iterations']} iterations")
+                print(f"{event['mines']}/{event['n']} mines were marked")
+        else:
+            action = "Opened" if event["event"] == "open" else "Marking"
+            source = f" from {tuple(event['source'])}" if event["source"] else ""
+            print(f"[{event['iteration']}] {action} {[tuple(pos) for pos in event['cells']]} thanks to {event['reason']}{source}")
+
+# Replay a solve step by step from its trace events, starting from the initial map
+# Yields every open/mark event with the board as it was right after it
+def replay(events, map):
+    board = parse_board(map)
+    for event in events:
+        if event["event"] in ("open", "mark"):
+            rows, columns = zip(*event["cells"])
+            board[rows, columns] = event["values"] if event["event"] == "open" else MINE
+            yield event, board
+
 ### Cached function in the kata (have to recode for testing here)
 def open(row, column, board=None, resolved=None, highlight=[]):
     val = result[row][column]
     if val == 'x':
-        print(f"Game over, exploded mine at {(row, column)}")
         # board[row, column] = "#"
         # fancyPrint(board, resolved, highlight + [(row, column)])
-        quit()
+        raise MineExploded((row, column))
     else:
         return val
 
+# Oracle over the kata's open function, used when a solve is given no oracle. open reads the game
+# from the module level result, which only the kata (or __main__ below) sets up
+def kata_oracle():
+    if "result" not in globals():
+        raise TypeError("no oracle given and no kata game to open cells on (module level result is not set)")
+    return FunctionOracle(open)
+
+### Game oracles: the game the solver opens cells on
+# Raised when an oracle is asked to open a mine
+class MineExploded(Exception):
+    def __init__(self, pos):
+        super().__init__(f"Game over, exploded mine at {pos}")
+        self.pos = pos
+
+    # Rebuilt from its position when sent back from a worker process
+    def __reduce__(self):
+        return MineExploded, (self.pos,)
+
+# Base oracle, subclasses implement open and/or open_many (each defaults to the other one)
+class Oracle:
+    # Open a single cell, returns its number
+    def open(self, row, column):
+        return self.open_many([(row, column)])[0]
+
+    # Open many cells in one call (one round trip for remote games), returns their numbers
+    def open_many(self, positions):
+        if type(self).open is Oracle.open:
+            raise NotImplementedError(f"{type(self).__name__} must implement open or open_many")
+        return [self.open(*pos) for pos in positions]
+
+# Wraps a single cell open(row, column) function, like the one provided by the kata
+class FunctionOracle(Oracle):
+    def __init__(self, function):
+        self.function = function
+
+    def open(self, row, column):
+        return self.function(row, column)
+
+# Game from a solved board (result string, int8 board or PackedBoard)
+# A PackedBoard is played straight from its memory map, only unpacking the cells opened
+class BoardOracle(Oracle):
+    def __init__(self, result):
+        if isinstance(result, PackedBoard):
+            self.board = result
+            self.n = result.n
+        else:
+            self.board = parse_board(result) if isinstance(result, str) else result
+            self.n = int((self.board == MINE).sum())
+
+    def open_many(self, positions):
+        rows, columns = np.array(positions, dtype=np.intp).reshape(-1, 2).T
+        if isinstance(self.board, PackedBoard):
+            values = self.board.cells(rows * self.board.W + columns)
+        else:
+            values = self.board[rows, columns]
+        if (values == MINE).any():
+            raise MineExploded(positions[int(np.argmax(values == MINE))])
+        return values.tolist()
+
+# Randomly generated game, numbers are only worked out for the cells that get opened
+# safe: position kept clear of mines all around (so it opens as a '0'), use gamemap() to start on it
+class GeneratedOracle(Oracle):
+    def __init__(self, H, W, n, safe=None, seed=None):
+        self.H, self.W, self.n = H, W, n
+        self.safe = safe
+        self.geo = geometry(H, W)
+        cells = np.arange(H * W)
+        if safe is not None:
+            center = safe[0] * W + safe[1]
+            cells = np.setdiff1d(cells, np.append(self.geo.near(center), center))
+        self.mines = np.zeros(H * W, dtype=bool)
+        self.mines[np.random.default_rng(seed).choice(cells, n, replace=False)] = True
+
+    # Starting map, with the safe cell revealed
+    def gamemap(self):
+        board = np.full((self.H, self.W), UNKNOWN, dtype=np.int8)
+        if self.safe is not None:
+            board[self.safe] = 0
+        return format_board(board)
+
+    def open(self, row, column):
+        cell = row * self.W + column
+        if self.mines[cell]:
+            raise MineExploded((row, column))
+        return int(self.mines[self.geo.near(cell)].sum())
+
+# Random board of H x W cells, each being a mine with probability density
+# The starting map has a single '0' cell revealed (the solver floods its region)
+# solvable: keep drawing boards until one can be solved without guessing (at most tries)
+# Returns (gamemap, result, n) with both boards int8 encoded
+def generate_board(H, W, density, seed=None, solvable=False, tries=100):
+    rng = np.random.default_rng(seed)
+    for _ in range(tries if solvable else 1):
+        mines = rng.random((H, W)) < density
+        result = np.where(mines, MINE, neighbour_sum(mines)).astype(np.int8)
+        n = int(mines.sum())
+
+        # Start from a random '0' cell, or any safe cell on boards too dense to have one
+        starts = np.flatnonzero(result == 0)
+        if not len(starts):
+            starts = np.flatnonzero(result >= 0)
+        gamemap = np.full((H, W), UNKNOWN, dtype=np.int8)
+        if len(starts):
+            start = rng.choice(starts)
+            gamemap.flat[start] = result.flat[start]
+
+        if not solvable or not isinstance(solve_mine(gamemap, n, BoardOracle(result), raw=True), str):
+            return gamemap, result, n
+    raise ValueError(f"No solvable {H}x{W} board with density {density} found in {tries} tries")
+
+# Game opened through a function taking a list of positions and returning their numbers,
+# so every solver step costs a single call (e.g. one request to a remote or IPC game)
+class BatchOracle(Oracle):
+    def __init__(self, open_cells):
+        self.open_cells = open_cells
+        self.calls = 0
+
+    def open_many(self, positions):
+        self.calls += 1
+        return list(self.open_cells(positions))
+
+### Batch solving
+# Compact encoding used to ship boards between processes: (H, W, int8 cell bytes)
+def encode_board(board):
+    board = parse_board(board) if isinstance(board, str) else np.asarray(board, dtype=np.int8)
+    return board.shape[0], board.shape[1], board.tobytes()
+
+def decode_board(encoded):
+    H, W, data = encoded
+    return np.frombuffer(data, dtype=np.int8).reshape(H, W)
+
+# Per worker process state, set once by the pool initializer
+WORKER = {}
+
+def init_worker(make_oracle, options, timed=False, errors=False):
+    WORKER.update(make_oracle=make_oracle, options=options, timed=timed, errors=errors)
+
+# Solve one (index, encoded map, n, game) task with the settings of a solve_many run
+def solve_task(task, make_oracle, options, timed=False, errors=False):
+    index, map, n, game = task
+    start = perf_counter()
+    try:
+        if isinstance(map, Exception):
+            raise map
+        oracle = make_oracle(decode_board(game) if isinstance(game, tuple) else game)
+        answer = solve_mine(decode_board(map), n, oracle, **options)
+    except Exception as error:
+        if not errors:
+            raise
+        answer = error
+    return (index, answer, perf_counter() - start) if timed else (index, answer)
+
+# Pool entry point: solve_task with the settings the worker was initialised with
+def worker_task(task):
+    return solve_task(task, **WORKER)
+
+# Solve many independent boards, spread over a pool of worker processes
+# boards: iterable of (map, n, game), game being what make_oracle builds the board's oracle from
+#         (for the default BoardOracle: the solved board). A map given as an exception (e.g. for a
+#         record which could not be read) is that board's error, and comes back in its place
+# workers: number of processes (None for one per CPU, 1 to solve in this process)
+# ordered: yield results in the order of boards, otherwise as soon as they finish
+# chunksize: boards handed to the pool ahead of the results, per worker
+# timed: also yield the seconds every board took in its worker
+# errors: yield the exception a board raised (e.g. MineExploded on an inconsistent board) as its
+#         result instead of stopping every other board with it
+# options: passed on to solve_mine
+# Yields (index of the board, solve_mine result[, seconds]) as they become available
+def solve_many(boards, workers=None, ordered=True, make_oracle=BoardOracle, chunksize=16, timed=False, errors=False, **options):
+    tasks = ((index, map if isinstance(map, Exception) else encode_board(map), n, encode_board(game) if isinstance(game, str) else game)
+             for index, (map, n, game) in enumerate(boards))
+
+    if workers == 1:
+        yield from (solve_task(task, make_oracle, options, timed, errors) for task in tasks)
+        return
+
+    import queue
+    from concurrent.futures import ProcessPoolExecutor # Only paid for by batch runs
+    slots = threading.Semaphore((workers or os.cpu_count() or 1) * chunksize) # Bounds the boards read ahead
+    results = queue.Queue() # Futures (in submission order when ordered, as they finish otherwise),
+                            # then the number of boards submitted, or the error reading them raised
+    stop = threading.Event()
+
+    with ProcessPoolExecutor(workers, initializer=init_worker, initargs=(make_oracle, options, timed, errors)) as pool:
+        # Boards are read in a thread of their own, so results keep coming while it waits on a slow input
+        def feed():
+            submitted = 0
+            try:
+                for task in tasks:
+                    slots.acquire()
+                    if stop.is_set():
+                        return
+                    future = pool.submit(worker_task, task)
+                    submitted += 1
+                    if ordered:
+                        results.put(future)
+                    else:
+                        future.add_done_callback(results.put)
+            except Exception as error:
+                results.put(error)
+                return
+            results.put(submitted)
+
+        threading.Thread(target=feed, daemon=True).start()
+        total, received = None, 0
+        try:
+            while (total is None) or (received < total):
+                item = results.get()
+                if isinstance(item, Exception):
+                    raise item
+                if isinstance(item, int):
+                    total = item
+                    continue
+                received += 1
+                slots.release()
+                yield item.result()
+        finally:
+            stop.set()
+            slots.release()
+            pool.shutdown(cancel_futures=True)
+
+### Async solving
+# Driver for games behind a high latency connection (e.g. a game server on a socket). Each solve
+# runs solve_mine in a thread of its own which only ever waits on the event loop: all the cells a
+# deduction pass opens go out as concurrent requests, and the passes of many boards interleave
+
+# Game whose opens are coroutines, subclasses implement open
+class AsyncOracle:
+    async def open(self, row, column):
+        raise NotImplementedError
+
+# In process stand-in for a remote game: a BoardOracle answering every open after latency seconds
+class LatencyOracle(AsyncOracle):
+    def __init__(self, result, latency=0.01):
+        self.game = BoardOracle(result)
+        self.latency = latency
+
+    async def open(self, row, column):
+        import asyncio
+        await asyncio.sleep(self.latency)
+        return self.game.open(row, column)
+
+# Oracle handed to solve_mine in a solving thread, running the opens of an AsyncOracle on the loop
+# limit: semaphore bounding the opens awaiting an answer (shared by every board of a run)
+class LoopOracle(Oracle):
+    def __init__(self, oracle, loop, limit):
+        self.oracle = oracle
+        self.loop = loop
+        self.limit = limit
+
+    def open_many(self, positions):
+        import asyncio
+        return asyncio.run_coroutine_threadsafe(self.fetch(positions), self.loop).result()
+
+    async def fetch(self, positions):
+        import asyncio
+        async def fetch_one(row, column):
+            async with self.limit:
+                return await self.oracle.open(row, column)
+        return await asyncio.gather(*(fetch_one(row, column) for row, column in positions))
+
+# Solve many boards against async games from a running event loop
+# boards: iterable of (map, n, game), game being what make_oracle builds the board's AsyncOracle from
+# concurrency: boards being solved at the same time
+# in_flight: opens awaiting an answer at any time, over all boards
+# options: passed on to solve_mine
+# Returns the solve_mine results, in the order of boards
+async def solve_async(boards, make_oracle=LatencyOracle, concurrency=16, in_flight=64, **options):
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+    loop = asyncio.get_running_loop()
+    limit = asyncio.Semaphore(in_flight)
+    with ThreadPoolExecutor(concurrency) as pool:
+        solves = [partial(solve_mine, map, n, LoopOracle(make_oracle(game), loop, limit), **options) for map, n, game in boards]
+        return await asyncio.gather(*(loop.run_in_executor(pool, solve) for solve in solves))
+
+### Solve cache
+# LRU cache in front of solve_mine for positions which keep coming back. Entries are keyed by a
+# hash of the starting board and n, and hold the moves the solve made: every batch of cells opened
+# (with the numbers they showed) and of mines marked. A hit replays the moves against the oracle
+# instead of deducing them again. Games with the same opening can still hide different mines, so
+# when a cell shows another number than recorded the replay stops there and solve_mine carries
+# on from that (still valid) position
+# max_bytes: memory bound of the cached moves, least recently used entries are dropped past it
+# path: optional dbm file the entries are also written to, so a restarted cache starts warm
+class SolveCache:
+    STATUSES = ("solved", "stuck") # Outcomes worth caching (budget runs stopped part way)
+
+    def __init__(self, max_bytes=64 << 20, path=None):
+        self.entries = OrderedDict()
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = self.misses = self.diverged = 0
+        self.store = None
+        if path is not None:
+            import dbm
+            self.store = dbm.open(path, "c")
+
+    # Hash of the compact starting board and the number of mines
+    @staticmethod
+    def key(board, n):
+        from hashlib import blake2b
+        return blake2b(HEADER.pack(MAGIC, board.shape[0], board.shape[1], n) + board.tobytes(), digest_size=16).digest()
+
+    # Entry as bytes: status code, then every move as (kind, cell count), int32 cells and for opens int8 numbers
+    @classmethod
+    def pack(cls, status, moves):
+        data = bytearray([cls.STATUSES.index(status)])
+        for cells, values in moves:
+            data += struct.pack("<BI", values is None, len(cells)) + cells.tobytes()
+            if values is not None:
+                data += values.tobytes()
+        return bytes(data)
+
+    @classmethod
+    def unpack(cls, data):
+        status, moves, k = cls.STATUSES[data[0]], [], 1
+        while k < len(data):
+            mark, count = struct.unpack_from("<BI", data, k)
+            k += 5
+            cells = np.frombuffer(data, dtype=np.int32, count=count, offset=k)
+            k += 4 * count
+            values = None
+            if not mark:
+                values = np.frombuffer(data, dtype=np.int8, count=count, offset=k)
+                k += count
+            moves.append((cells, values))
+        return status, moves
+
+    def get(self, key):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        if (self.store is not None) and (key in self.store):
+            entry = self.unpack(self.store[key])
+            self.put(key, entry, persist=False)
+            return entry
+        return None
+
+    def put(self, key, entry, persist=True):
+        if persist and (self.store is not None):
+            self.store[key] = self.pack(*entry)
+        self.entries[key] = entry
+        self.bytes += sum(cells.nbytes + (0 if values is None else values.nbytes) for cells, values in entry[1])
+        while (self.bytes > self.max_bytes) and self.entries:
+            _, (_, moves) = self.entries.popitem(last=False)
+            self.bytes -= sum(cells.nbytes + (0 if values is None else values.nbytes) for cells, values in moves)
+
+    # Counters for sizing the cache
+    def info(self):
+        return {"hits": self.hits, "misses": self.misses, "diverged": self.diverged, "entries": len(self.entries), "bytes": self.bytes}
+
+    def close(self):
+        if self.store is not None:
+            self.store.close()
+
+    # Same arguments and results as solve_mine (a solve with its own trace bypasses the cache)
+    # On a hit max_steps and time_limit are not applied, the replay only makes the recorded moves,
+    # and stats gets their count under a "cache replay" phase with the recorded status
+    def solve(self, map, n, oracle=None, **options):
+        if isinstance(map, PackedBoard):
+            board = map.unpack()
+        else:
+            board = parse_board(map) if isinstance(map, str) else np.array(map, dtype=np.int8)
+        trace = options.pop("trace", None)
+        if trace is not None:
+            return solve_mine(board, n, oracle, trace=trace, **options)
+        oracle = oracle or kata_oracle()
+        key = self.key(board, n)
+        entry = self.get(key)
+
+        if entry is None:
+            self.misses += 1
+            sink = RingSink(capacity=None)
+            answer = solve_mine(board.copy(), n, oracle, trace=Trace(sink, STEPS), **options)
+            W = board.shape[1]
+            moves = [(np.array([r * W + c for r, c in event["cells"]], dtype=np.int32), None if event["values"] is None else np.array(event["values"], dtype=np.int8))
+                     for event in sink.events if event["event"] in ("open", "mark")]
+            status = sink.events[-1]["status"]
+            if status in self.STATUSES:
+                self.put(key, (status, moves))
+            return answer
+
+        self.hits += 1
+        status, moves = entry
+        stats = options.get("stats")
+        start = perf_counter()
+        flat = board.reshape(-1)
+        for cells, values in moves:
+            if values is None:
+                flat[cells] = MINE
+                if stats: stats.pending["marked"] += len(cells)
+                continue
+            rows, columns = np.divmod(cells, board.shape[1])
+            flat[cells] = oracle.open_many(list(zip(rows.tolist(), columns.tolist())))
+            if stats: stats.pending["opened"] += len(cells)
+            if (flat[cells] != values).any():
+                self.diverged += 1
+                if stats: stats.lap("cache replay", start)
+                return solve_mine(board, n, oracle, **options)
+
+        if stats:
+            stats.lap("cache replay", start)
+            stats.status = status
+
+        if status == "solved":
+            return board if options.get("raw") else format_board(board)
+        return mine_probabilities(board, n) if options.get("probabilities") else "?"
+
+### Tiled solving
+# Deductions of one tile: window is the tile plus a 2 cell margin, core the (row, column) slices of
+# the window whose revealed cells can be used as constraints (the tile plus 1 cell, so every one of
+# them sees its whole neighbourhood inside the window)
+# Returns (safe, mines) lists of window positions
+def tile_deductions(window, core):
+    where = np.zeros(window.shape, dtype=bool)
+    where[core] = True
+    safe, mines = first_level(window, where)
+    safe, mines = set(np.flatnonzero(safe).tolist()), set(np.flatnonzero(mines).tolist())
+
+    # Second level logic between the constraints of the tile
+    geo = geometry(*window.shape)
+    frontier = np.flatnonzero(where & (window >= 0) & (neighbour_sum(window == UNKNOWN) > 0)).tolist()
+    subsetSafe, subsetMines = subset_deductions(constraints(window.reshape(-1), geo, frontier))
+    W = window.shape[1]
+    return [divmod(cell, W) for cell in safe | subsetSafe], [divmod(cell, W) for cell in mines | subsetMines]
+
+# Solve a board tile by tile, with only a few tiles unpacked at any time: the board is kept packed
+# two cells per byte (a PackedBoard file is mapped copy on write, so only the pages of the tiles
+# worked are ever read) and every tile is unpacked with a 2 cell margin when it is worked.
+# Tiles run the local first and second level logic, which also covers the seams since every tile
+# sees the constraints 1 cell past its edges, and only tiles around cells that changed are worked
+# again. Once no tile makes progress the frontier constraints of all tiles are gathered for the
+# global logic (remaining mine count, exact enumeration), and tiles start over if it found anything
+# tile: tile side length, workers: processes working tiles in parallel (1 works them in this process)
+# raw, probabilities: as for solve_mine
+def solve_tiled(map, n, oracle=None, tile=256, workers=1, raw=False, probabilities=False):
+    if isinstance(map, PackedBoard):
+        board = PackedBoard(map.path, mode="c") if map.path is not None else PackedBoard.from_board(map.unpack(), map.n)
+    else:
+        board = PackedBoard.from_board(parse_board(map) if isinstance(map, str) else np.asarray(map, dtype=np.int8))
+    oracle = oracle or kata_oracle()
+    H, W = board.shape
+    rows, columns = (H + tile - 1) // tile, (W + tile - 1) // tile
+    every = [(i, j) for i in range(rows) for j in range(columns)]
+
+    # Cells of a rectangle, unpacked
+    def read(top, left, bottom, right):
+        return board.cells((np.arange(top, bottom)[:, None] * W + np.arange(left, right)).reshape(-1)).reshape(bottom - top, right - left)
+
+    # Window (with margin) and constraint slices of a tile
+    def window(t):
+        r0, c0 = t[0] * tile, t[1] * tile
+        top, left = max(r0 - 2, 0), max(c0 - 2, 0)
+        bottom, right = min(r0 + tile + 2, H), min(c0 + tile + 2, W)
+        core = (slice(max(r0 - 1, 0) - top, min(r0 + tile + 1, H) - top), slice(max(c0 - 1, 0) - left, min(c0 + tile + 1, W) - left))
+        return (top, left), read(top, left, bottom, right), core
+
+    # Own cells of a tile (no margin), with the position of its top left corner
+    def own(t):
+        r0, c0 = t[0] * tile, t[1] * tile
+        return (r0, c0), read(r0, c0, min(r0 + tile, H), min(c0 + tile, W))
+
+    # Tiles whose window contains a cell
+    def tiles_around(r, c):
+        return [(i, j) for i in range(max(r - 2, 0) // tile, min(r + 2, H - 1) // tile + 1)
+                       for j in range(max(c - 2, 0) // tile, min(c + 2, W - 1) // tile + 1)]
+
+    # Open cells through the oracle, flooding '0' regions across tiles
+    # Returns every position which changed
+    def open_cells(positions):
+        changed = []
+        while positions:
+            positions = list(dict.fromkeys(positions))
+            codes = board.cells([r * W + c for r, c in positions])
+            positions = [pos for pos, code in zip(positions, codes.tolist()) if code == UNKNOWN]
+            if not positions:
+                break
+            values = [int(value) for value in oracle.open_many(positions)]
+            board.set([r * W + c for r, c in positions], values)
+            changed += positions
+            positions = [(r + di, c + dj) for (r, c), value in zip(positions, values) if value == 0
+                         for di, dj in Geometry.STEPS if (0 <= r + di < H) & (0 <= c + dj < W)]
+        return changed
+
+    # Tag cells as mines, returns those which were still unknown
+    def mark(positions):
+        positions = list(dict.fromkeys(positions))
+        codes = board.cells([r * W + c for r, c in positions])
+        positions = [pos for pos, code in zip(positions, codes.tolist()) if code == UNKNOWN]
+        board.set([r * W + c for r, c in positions], [MINE] * len(positions))
+        return positions
+
+    # Tile pass, until no tile makes progress
+    def work(live, pool):
+        while live:
+            work = sorted(live)
+            live = set()
+            windows = [window(t) for t in work]
+            tasks = [(view, core) for _, view, core in windows]
+            results = pool.map(tile_deductions, *zip(*tasks)) if pool else (tile_deductions(*task) for task in tasks)
+
+            safe, mines = [], []
+            for ((top, left), _, _), (tileSafe, tileMines) in zip(windows, results):
+                safe += [(top + r, left + c) for r, c in tileSafe]
+                mines += [(top + r, left + c) for r, c in tileMines]
+            for pos in mark(mines) + open_cells(safe):
+                live.update(tiles_around(*pos))
+
+    # Global logic over the frontier constraints of every tile
+    # Returns the cells it opened or marked
+    def settle():
+        rules, unknowns, found = {}, 0, 0
+        for t in every:
+            (top, left), view, core = window(t)
+            (r0, c0), cells = own(t)
+            unknowns += int((cells == UNKNOWN).sum())
+            found += int((cells == MINE).sum())
+            # Constraints of the tile's own revealed cells, over global cell ids
+            inside = np.zeros(view.shape, dtype=bool)
+            inside[r0 - top:r0 - top + cells.shape[0], c0 - left:c0 - left + cells.shape[1]] = True
+            frontier = np.flatnonzero(inside & (view >= 0) & (neighbour_sum(view == UNKNOWN) > 0)).tolist()
+            w = view.shape[1]
+            for group, count in constraints(view.reshape(-1), geometry(*view.shape), frontier).items():
+                rules[frozenset((top + cell // w) * W + left + cell % w for cell in group)] = count
+
+        remaining = n - found
+        if remaining == 0:
+            return open_cells([divmod(cell, W) for t in every for cell in unknown_cells(t)])
+        if unknowns == remaining:
+            return mark([divmod(cell, W) for t in every for cell in unknown_cells(t)])
+        if not rules:
+            return []
+        interior = unknowns - len(frozenset().union(*rules))
+        total, weights, interiorWeight = solution_weights(rules, remaining, interior) or (0, {}, 0)
+        if not total:
+            return []
+        mines = [divmod(cell, W) for cell, weight in weights.items() if weight == total]
+        safe = [divmod(cell, W) for cell, weight in weights.items() if weight == 0]
+        if interior and (interiorWeight in (0, total)):
+            inside = [divmod(cell, W) for t in every for cell in unknown_cells(t) if cell not in weights]
+            (mines if interiorWeight else safe).extend(inside)
+        return mark(mines) + open_cells(safe)
+
+    # Global ids of the unknown cells of a tile
+    def unknown_cells(t):
+        (r0, c0), cells = own(t)
+        r, c = np.nonzero(cells == UNKNOWN)
+        return ((r0 + r) * W + c0 + c).tolist()
+
+    # Only tiles with a live frontier (revealed cells next to unknowns) start out live
+    live = set()
+    for t in every:
+        _, view, core = window(t)
+        if ((view[core] >= 0) & (neighbour_sum(view == UNKNOWN)[core] > 0)).any():
+            live.add(t)
+
+    pool = None
+    if workers != 1:
+        from concurrent.futures import ProcessPoolExecutor
+        pool = ProcessPoolExecutor(workers)
+    try:
+        while True:
+            work(live, pool)
+            changed = settle()
+            if not changed:
+                break
+            live = set(t for pos in changed for t in tiles_around(*pos))
+    finally:
+        if pool:
+            pool.shutdown()
+
+    if any(unknown_cells(t) for t in every):
+        return mine_probabilities(board.unpack(), n) if probabilities else "?"
+    return board.unpack() if raw else format_board(board.unpack())
+
+### Bitboard backend
+# Alternative solver for small and medium boards (up to ~64x64) keeping every cell set as a Python
+# int bitboard: bit r * S + c is cell (r, c), with S = W + 1 so a guard column of zeros stops shifts
+# from wrapping around rows. Neighbour counts of all cells are worked out at once with bit-sliced
+# adders (4 bit planes per count), so each pass is a handful of big int operations
+class Bitboard:
+    def __init__(self, H, W):
+        self.H, self.W, self.S = H, W, W + 1
+        self.full = sum(((1 << W) - 1) << (r * self.S) for r in range(H)) # Every valid cell
+
+    # The mask shifted onto each of its 8 neighbouring positions
+    def shifts(self, mask):
+        S, full = self.S, self.full
+        return [(mask << k) & full for k in (1, S - 1, S, S + 1)] + [(mask >> k) & full for k in (1, S - 1, S, S + 1)]
+
+    # Cells next to at least one cell of the mask
+    def near(self, mask):
+        around = 0
+        for shifted in self.shifts(mask):
+            around |= shifted
+        return around
+
+    # Number of neighbours in the mask of every cell, as 4 bit planes (bit k of the count)
+    def count(self, mask):
+        planes = [0, 0, 0, 0]
+        for carry in self.shifts(mask):
+            for k in range(4):
+                planes[k], carry = planes[k] ^ carry, planes[k] & carry
+                if not carry:
+                    break
+        return planes
+
+    # Cells where two plane numbers are equal
+    def equal(self, a, b):
+        different = 0
+        for x, y in zip(a, b):
+            different |= x ^ y
+        return self.full & ~different
+
+    # Bit-sliced addition of two plane numbers
+    @staticmethod
+    def add(a, b):
+        planes, carry = [], 0
+        for x, y in zip(a, b):
+            planes.append(x ^ y ^ carry)
+            carry = (x & y) | (carry & (x ^ y))
+        return planes
+
+# Indices of the set bits of a mask
+def bits(mask):
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+# Solve a board with the bitboard backend, same arguments and results as solve_mine
+# (batched is accepted for compatibility: first level logic always runs on every cell at once here)
+def solve_mine_bitboard(map, n, oracle=None, batched=False, probabilities=False, trace=None, raw=False, stats=None, max_steps=None, time_limit=None):
+    if isinstance(map, PackedBoard):
+        board = map.unpack()
+    else:
+        board = parse_board(map) if isinstance(map, str) else np.array(map, dtype=np.int8)
+    H, W = board.shape
+    bb = Bitboard(H, W)
+    S = bb.S
+    oracle = oracle or kata_oracle()
+    trace = trace or NO_TRACE
+    deadline = None if time_limit is None else perf_counter() + time_limit
+    exhausted = False # A budget ran out before reaching a fixed point
+
+    unknown = mines = revealed = 0
+    values = [0, 0, 0, 0] # Bit planes of the numbers on revealed cells
+    for (r, c), value in np.ndenumerate(board):
+        b = 1 << (r * S + c)
+        if value == UNKNOWN:
+            unknown |= b
+        elif value == MINE:
+            mines |= b
+        else:
+            revealed |= b
+            for k in range(4):
+                if (value >> k) & 1:
+                    values[k] |= b
+
+    def out_of_time():
+        return (deadline is not None) and (perf_counter() > deadline)
+
+    # Open the cells of a mask through the oracle
+    def uncover(mask, reason):
+        nonlocal unknown, revealed
+        cells = list(bits(mask))
+        if cells:
+            opened = oracle.open_many([divmod(cell, S) for cell in cells])
+            for cell, value in zip(cells, opened):
+                for k in range(4):
+                    if (int(value) >> k) & 1:
+                        values[k] |= 1 << cell
+            unknown &= ~mask
+            revealed |= mask
+            if stats: stats.pending["opened"] += len(cells)
+            if trace.level >= STEPS: trace.step(i, "open", [divmod(cell, S) for cell in cells], [int(value) for value in opened], reason, None)
+
+    # Tag the cells of a mask as mines
+    def flag(mask, reason):
+        nonlocal unknown, mines
+        mask &= unknown
+        mines |= mask
+        unknown &= ~mask
+        if stats: stats.pending["marked"] += mask.bit_count()
+        if (trace.level >= STEPS) & bool(mask): trace.step(i, "mark", [divmod(cell, S) for cell in bits(mask)], None, reason, None)
+
+    # Number and unknowns around a revealed cell, as a (unknowns mask, mines left) constraint
+    def constraint(cell):
+        around = bb.near(1 << cell)
+        value = sum(((values[k] >> cell) & 1) << k for k in range(4))
+        return around & unknown, value - (around & mines).bit_count()
+
+    # Back to the int8 encoding, and the mask of resolved cells by cell id (for the trace)
+    def decode():
+        for cell in bits(mines):
+            board[divmod(cell, S)] = MINE
+        for cell in bits(revealed):
+            board[divmod(cell, S)] = sum(((values[k] >> cell) & 1) << k for k in range(4))
+        resolved = np.zeros(H * W, dtype=bool)
+        for cell in bits((mines | revealed) & ~bb.near(unknown)):
+            r, c = divmod(cell, S)
+            resolved[r * W + c] = True
+        return resolved
+
+    didSomething = True
+
+    i = 0
+    if trace.level >= BOARDS: trace.board(i, board, decode())
+    while (mines.bit_count() != n) & didSomething:
+        if ((max_steps is not None) and (i >= max_steps)) or out_of_time():
+            exhausted = True
+            break
+        didSomething = False
+        if stats: start = perf_counter()
+
+        ## First level logic on every cell at once, until it stops making progress
+        while True:
+            tagged = bb.count(mines)
+            around = bb.count(unknown)
+            live = revealed & (around[0] | around[1] | around[2] | around[3])
+            if stats: stats.pending["examined"] += H * W
+            saturated = live & bb.equal(values, tagged)
+            full = live & bb.equal(values, bb.add(tagged, around))
+            newMines = bb.near(full) & unknown
+            safe = bb.near(saturated) & unknown & ~newMines
+            if not (newMines | safe):
+                break
+            flag(newMines, "batched 1st level logic")
+            uncover(safe, "batched 1st level logic")
+            didSomething = True
+            if out_of_time():
+                exhausted = True
+                break
+        if stats: start = stats.lap("batched", start)
+        if exhausted:
+            break
+
+        ## Second level logic: compare overlapping constraints
+        rules = {}
+        for cell in bits(live):
+            cells, count = constraint(cell)
+            rules[cells] = count
+        index = {} # Unknown cell -> constraints containing it
+        for cells in rules:
+            for pos in bits(cells):
+                index.setdefault(pos, []).append(cells)
+        newMines = safe = 0
+        for a, countA in rules.items():
+            for b in set(b for pos in bits(a) for b in index[pos]) - {a}:
+                onlyB = b & ~a
+                if rules[b] - onlyB.bit_count() == countA:
+                    newMines |= onlyB
+                    safe |= a & ~b
+        if stats:
+            stats.pending["examined"] += len(rules)
+            start = stats.lap("second level", start)
+        if newMines | safe:
+            flag(newMines, "constraint pair logic")
+            uncover(safe & ~newMines, "constraint pair logic")
+            didSomething = True
+        else:
+            ## Endgame: remaining unknowns are all mines, or exact enumeration of the frontier
+            # (components too large to enumerate are skipped, see COMPONENT_LIMIT)
+            left = n - mines.bit_count()
+            if unknown.bit_count() == left:
+                flag(unknown, "remaining mine count")
+                didSomething = True
+            elif rules:
+                frontierCells = 0
+                for cells in rules:
+                    frontierCells |= cells
+                interior = unknown.bit_count() - frontierCells.bit_count()
+                try:
+                    total, weights, interiorWeight = solution_weights({frozenset(bits(cells)): count for cells, count in rules.items()}, left, interior, deadline) or (0, {}, 0)
+                except BudgetExhausted:
+                    exhausted = True
+                    break
+                if total:
+                    newMines = sum(1 << cell for cell, weight in weights.items() if weight == total)
+                    safe = sum(1 << cell for cell, weight in weights.items() if weight == 0)
+                    if interior and (interiorWeight in (0, total)):
+                        inside = unknown & ~frontierCells
+                        newMines, safe = (newMines | inside, safe) if interiorWeight else (newMines, safe | inside)
+                    if newMines | safe:
+                        flag(newMines, "exact enumeration (mine in every solution)")
+                        uncover(safe, "exact enumeration (safe in every solution)")
+                        didSomething = True
+                if stats:
+                    stats.pending["examined"] += len(rules)
+                    start = stats.lap("exact", start)
+
+        if trace.level >= BOARDS: trace.board(i, board, decode())
+        if stats: stats.iteration(i, live.bit_count())
+        i += 1
+
+    # Game is over, just need to reveal remaining unknowns
+    if mines.bit_count() == n:
+        if stats: start = perf_counter()
+        uncover(unknown, "all mines found")
+        if stats: stats.lap("endgame", start)
+    decode()
+
+    if not (unknown & ~mines):
+        status = "solved"
+    else:
+        status = "budget" if exhausted else "stuck"
+    if stats: stats.status = status
+    if trace.level >= SUMMARY: trace.result(status, i, mines.bit_count(), n)
+    if status != "stuck":
+        return board if raw else format_board(board)
+    if probabilities:
+        return mine_probabilities(board, n)
+    return "?"
+
 ### For Debugging
 # Simple print board
 def pr(A):
@@ -280,18 +1908,20 @@ def pr(A):
     print()
 
 # Print board with colors
+# (resolved and highlight hold linear cell indices)
 def fancyPrint(board, resolved, highlight=[]):
     i = 0
     for row in board:
         j = 0
-        for item in row:
-            if (i, j) in highlight:
+        for item in SYMBOLS[row + 2]:
+            cell = i * len(row) + j
+            if cell in highlight:
                 print(f"{colors.HIGHLIGHT}{item}{colors.END}", end=" ")
-            elif item == "*" or item == "x":
+            elif item == "x":
                 print(f"{colors.MINE}*{colors.END}", end=" ")
             elif item == "?":
                 print(f"{colors.UNKNOWN}?{colors.END}", end=" ")
-            elif (i, j) in resolved:
+            elif cell in resolved:
                 print(f"{colors.RESOLVED}{item}{colors.END}", end=" ")
             else:
                 print(item, end=" ")
@@ -301,20 +1931,22 @@ def fancyPrint(board, resolved, highlight=[]):
     print()
 
 ### Testing
-from tests import tests
-import re
-
-# 2, 3 are 50%, should return "?"
-# FAILS: 12, 14 <- need trial and error logic here (relies on knowldge of number of mines remaining)
-testID = 12
-gamemap, result = (tests[testID]["gamemap"], tests[testID]["result"])
-
-# Find number of mines
-n = re.split('\s|\n', result).count('x')
-
-# Format result in a usable way for the open function
-result = [row.split(' ') for row in result.split("\n")]
-# Solve the game
-ans = solve_mine(gamemap, n)
-print(ans)
-# fancyPrint(result, set())
+# Only when run as a script: importing the module solves nothing and prints nothing
+if __name__ == "__main__":
+    from tests import tests
+    import re
+
+    # 2, 3 are 50%, should return "?"
+    # 12, 14 need trial and error logic (relies on knowldge of number of mines remaining)
+    testID = 12
+    gamemap, result = (tests[testID]["gamemap"], tests[testID]["result"])
+
+    # Find number of mines
+    n = re.split(r'\s|\n', result).count('x')
+
+    # Format result in a usable way for the open function
+    result = [row.split(' ') for row in result.split("\n")]
+    # Solve the game
+    ans = solve_mine(gamemap, n, trace=Trace(ConsoleSink(), BOARDS))
+    print(ans)
+    # fancyPrint(result, set())
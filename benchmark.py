@@ -0,0 +1,139 @@
+'''
+BENCHMARK:
+ - Generate seeded random boards for every size (see MineSweeper.generate_board)
+ - Time solve_mine on them phase by phase (zero opening, first level, satisfied cells, patterns,
+   second level, endgame, exact enumeration), with the work counters of every phase
+ - Report throughput (cells/sec, boards/sec) and peak memory for every size
+ - With --latency, solve boards against in process games answering every open after a delay
+   (see MineSweeper.solve_async) and report boards/sec for every latency and concurrency
+ - Measure the cold import time of the module in fresh interpreters, optionally failing when it
+   goes over a bound (--max-import) so short lived workers keep starting fast
+ - Write the results as JSON so runs of different versions can be compared (--compare)
+
+Usage: python benchmark.py --sizes 8 64 512 2000 --density 0.15 --out results.json
+       python benchmark.py --sizes 16 --boards 32 --latency 0.005 0.05 --concurrency 1 8 32
+'''
+import argparse
+import asyncio
+import json
+import platform
+import subprocess
+import sys
+import tracemalloc
+from functools import partial
+from time import perf_counter
+
+from MineSweeper import BoardOracle, LatencyOracle, Stats, generate_board, solve_async, solve_mine
+
+SIZES = [8, 16, 32, 64, 128, 256, 512, 1000, 2000]
+
+# Version of the code being measured (git commit if available)
+def version():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+# Cold import time of MineSweeper: best of several fresh interpreters (dependencies included)
+def import_time(runs=5):
+    code = "from time import perf_counter; start = perf_counter(); import MineSweeper; print(perf_counter() - start)"
+    return min(float(subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout) for _ in range(runs))
+
+# Benchmark one board size: boards are solved once timed, then again under tracemalloc for peak memory
+def run_size(size, density, boards, seed, solvable, batched):
+    stats = Stats()
+    solved = 0
+    elapsed = 0
+    peak = 0
+    for k in range(boards):
+        gamemap, result, n = generate_board(size, size, density, seed=seed + k, solvable=solvable)
+
+        start = perf_counter()
+        answer = solve_mine(gamemap, n, BoardOracle(result), batched=batched, raw=True, stats=stats)
+        elapsed += perf_counter() - start
+        solved += not isinstance(answer, str)
+
+        tracemalloc.start()
+        solve_mine(gamemap, n, BoardOracle(result), batched=batched, raw=True)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+    return {
+        "size": size,
+        "density": density,
+        "boards": boards,
+        "solved": solved,
+        "seconds": elapsed,
+        "cells_per_sec": size * size * boards / elapsed,
+        "boards_per_sec": boards / elapsed,
+        "peak_bytes": peak,
+        "phases": stats.time,
+        "counts": stats.counts,
+    }
+
+# Benchmark solving boards against games with an oracle latency (seconds per open), solve_async
+# running concurrency boards at once
+def run_latency(size, density, boards, seed, latency, concurrency):
+    games = [generate_board(size, size, density, seed=seed + k) for k in range(boards)]
+    start = perf_counter()
+    answers = asyncio.run(solve_async([(gamemap, n, result) for gamemap, result, n in games], make_oracle=partial(LatencyOracle, latency=latency),
+                                      concurrency=concurrency, in_flight=4 * concurrency, raw=True))
+    elapsed = perf_counter() - start
+    return {
+        "size": size,
+        "latency": latency,
+        "concurrency": concurrency,
+        "boards": boards,
+        "solved": sum(not isinstance(answer, str) for answer in answers),
+        "seconds": elapsed,
+        "boards_per_sec": boards / elapsed,
+    }
+
+# Print the speed change of every size against a previous results file
+def compare(results, path):
+    with open(path) as file:
+        previous = {run["size"]: run for run in json.load(file)["runs"]}
+    for run in results["runs"]:
+        if run["size"] in previous:
+            ratio = run["cells_per_sec"] / previous[run["size"]]["cells_per_sec"]
+            print(f"{run['size']:>5}: {ratio:.2f}x cells/sec vs {path}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark solve_mine on random boards")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="board side lengths")
+    parser.add_argument("--density", type=float, default=0.15, help="probability of a cell being a mine")
+    parser.add_argument("--boards", type=int, default=3, help="boards per size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--solvable", action="store_true", help="only use boards solvable without guessing")
+    parser.add_argument("--batched", action="store_true", help="use batched first level logic")
+    parser.add_argument("--out", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="previous results file to compare against")
+    parser.add_argument("--latency", type=float, nargs="+", help="oracle latencies (seconds) to benchmark solve_async with, instead of solve_mine")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64], help="boards solved at once with --latency")
+    parser.add_argument("--max-import", type=float, help="fail when a cold import takes longer than this many seconds")
+    args = parser.parse_args()
+
+    results = {"version": version(), "python": platform.python_version(), "import_seconds": import_time(), "runs": []}
+    print(f"cold import {results['import_seconds'] * 1000:.1f} ms")
+    for size in ([] if args.latency else args.sizes):
+        run = run_size(size, args.density, args.boards, args.seed, args.solvable, args.batched)
+        results["runs"].append(run)
+        phases = ", ".join(f"{phase} {seconds:.3f}s" for phase, seconds in run["phases"].items())
+        print(f"{size:>5}x{size:<5} {run['cells_per_sec']:>12,.0f} cells/s {run['boards_per_sec']:>9.2f} boards/s "
+              f"{run['peak_bytes'] / 2**20:>8.1f} MiB peak  {run['solved']}/{run['boards']} solved  ({phases})")
+
+    for size in (args.sizes if args.latency else []):
+        for latency in args.latency:
+            for concurrency in args.concurrency:
+                run = run_latency(size, args.density, args.boards, args.seed, latency, concurrency)
+                results.setdefault("latency_runs", []).append(run)
+                print(f"{size:>5}x{size:<5} {latency * 1000:>5.0f} ms latency {concurrency:>4} at once {run['boards_per_sec']:>9.2f} boards/s  "
+                      f"{run['solved']}/{run['boards']} solved")
+
+    if args.out:
+        with open(args.out, "w") as file:
+            json.dump(results, file, indent=2)
+    if args.compare:
+        compare(results, args.compare)
+    if (args.max_import is not None) and (results["import_seconds"] > args.max_import):
+        sys.exit(f"cold import took {results['import_seconds']:.3f}s, over the {args.max_import}s bound")
@@ -0,0 +1,111 @@
+'''
+SOLVE:
+ - Read boards to solve from files or from stdin, as a stream of records:
+    - JSON lines: one {"gamemap": ..., "result": ..., "n": ...} object per line (the tests.py
+      format), "n" defaults to the mines of "result" and an optional "id" names the board
+    - Text files: boards separated by blank lines, every game map followed by its solved board
+ - Solve them with solve_mine (through solve_many, over several processes with --workers)
+ - Write one JSON line per board: its id, status (solved, stuck, budget), the answer and the
+   seconds it took, then the end to end throughput on stderr. A record which can't be read or a
+   board which can't be solved (e.g. its game does not match its map) gets an "error" status line
+   with the reason, and the other boards carry on
+
+Usage: python solve.py boards.jsonl games.txt --workers 4 > answers.jsonl
+       cat boards.jsonl | python solve.py
+'''
+import argparse
+import io
+import json
+import sys
+from time import perf_counter
+
+from MineSweeper import MINE, parse_board, read_boards, solve_many
+
+# Records of a JSON lines stream, as (id, gamemap, n, result)
+# A record which can't be read comes as (id, error, None, None)
+def read_records(stream, name):
+    for line, text in enumerate(stream, 1):
+        if text.strip():
+            id = f"{name}:{line}"
+            try:
+                record = json.loads(text)
+                id = record.get("id", id)
+                result = parse_board(record["result"])
+                gamemap = parse_board(record["gamemap"])
+                if (gamemap is None) or (result is None):
+                    raise ValueError("empty board")
+                n = int(record["n"]) if "n" in record else int((result == MINE).sum())
+            except (ValueError, KeyError, TypeError, AttributeError) as error:
+                yield id, error, None, None
+                continue
+            yield id, gamemap, n, result
+
+# Records of a text file of (game map, solved board) pairs
+# A malformed board ends the file with an error record, as the boards after it can't be told apart
+def read_pairs(path):
+    try:
+        with io.open(path, "rb") as file:
+            boards = read_boards(file)
+            for k, gamemap in enumerate(boards):
+                result = next(boards, None)
+                if result is None:
+                    raise ValueError(f"board {k} has no solved board after it")
+                yield f"{path}:{k}", gamemap, int((result == MINE).sum()), result
+    except (OSError, ValueError) as error:
+        yield path, error, None, None
+
+# Every record of the inputs, stdin when there are none
+def records(paths):
+    if not paths:
+        yield from read_records(sys.stdin, "stdin")
+    for path in paths:
+        if path == "-":
+            yield from read_records(sys.stdin, "stdin")
+        elif path.endswith((".jsonl", ".json")):
+            with io.open(path) as file:
+                yield from read_records(file, path)
+        else:
+            yield from read_pairs(path)
+
+# Outcome of a solve_mine answer
+def status(answer):
+    if answer == "?":
+        return "stuck"
+    return "budget" if "?" in answer else "solved"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Solve minesweeper boards, writing the answers as JSON lines")
+    parser.add_argument("inputs", nargs="*", help="JSON lines (.jsonl) or text board files, stdin when none or -")
+    parser.add_argument("--workers", type=int, default=1, help="solving processes (0 for one per CPU)")
+    parser.add_argument("--unordered", action="store_true", help="write answers as they finish instead of in input order")
+    parser.add_argument("--batched", action="store_true", help="use batched first level logic")
+    parser.add_argument("--max-steps", type=int, help="main loop iterations allowed per board")
+    parser.add_argument("--time-limit", type=float, help="seconds allowed per board")
+    parser.add_argument("--out", help="write the answers to this file instead of stdout")
+    args = parser.parse_args()
+
+    # Records which can't be read go through the solver too (their error as the map), so their
+    # error lines keep their place in the output
+    ids = []
+    def boards():
+        for id, gamemap, n, result in records(args.inputs):
+            ids.append(id)
+            yield gamemap, n, result
+
+    out = io.open(args.out, "w") if args.out else sys.stdout
+    start = perf_counter()
+    solved = failed = total = 0
+    for index, answer, seconds in solve_many(boards(), workers=args.workers or None, ordered=not args.unordered, timed=True, errors=True,
+                                             batched=args.batched, max_steps=args.max_steps, time_limit=args.time_limit):
+        total += 1
+        if isinstance(answer, Exception):
+            failed += 1
+            out.write(json.dumps({"id": ids[index], "status": "error", "error": str(answer) or type(answer).__name__, "seconds": seconds}) + "\n")
+            continue
+        outcome = status(answer)
+        solved += outcome == "solved"
+        out.write(json.dumps({"id": ids[index], "status": outcome, "answer": answer, "seconds": seconds}) + "\n")
+    elapsed = perf_counter() - start
+    if args.out:
+        out.close()
+    print(f"{total} boards ({solved} solved, {failed} errors) in {elapsed:.3f}s, {total / elapsed if elapsed else 0:.1f} boards/s", file=sys.stderr)